@@ -0,0 +1,239 @@
+"""HTTP routes served by the Flask server next to the Dash app."""
+import json
+import os
+import re
+import time
+
+from flask import Blueprint, Response, abort, jsonify, request, stream_with_context, url_for
+from werkzeug.exceptions import HTTPException
+
+import metrics
+from jobs import TooManyCombinations, WorkersBusy, find_all_variants
+from params import BATCH_DEFAULTS, validate_item
+from result_store import results, variants_cache
+from serving import encode_stream, gzip_chunks, negotiate_encoding
+from workers import imap_ordered, iter_serialized, leet_chunk
+
+# Approximate size of each chunk sent in a streamed response
+STREAM_CHUNK_SIZE = 64 * 1024
+# Seconds a client is asked to wait before coming back for a result being enumerated
+DOWNLOAD_RETRY_AFTER = 1
+
+# Maximum number of texts accepted by a batch request
+BATCH_MAX_ITEMS = int(os.environ.get("LEET_BATCH_MAX_ITEMS", 100000))
+# Number of texts sent to a pool process at once
+BATCH_CHUNK_SIZE = 64
+
+api = Blueprint("api", __name__)
+
+
+@api.errorhandler(HTTPException)
+def handle_http_error(e):
+    """Report errors of the API routes as JSON instead of HTML pages."""
+    return jsonify(error=e.description), e.code
+
+
+def iter_chunks(lines, chunk_size=STREAM_CHUNK_SIZE):
+    """Group text lines into encoded chunks of roughly ``chunk_size`` bytes."""
+    buffer = []
+    size = 0
+    for line in lines:
+        line = line.encode("utf-8")
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def compressed_response(chunks, mimetype, headers=None):
+    """Streamed response, compressed on the fly when the client accepts it."""
+    headers = dict(headers or {}, Vary="Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is not None:
+        chunks = encode_stream(chunks, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(
+        stream_with_context(metrics.metered(chunks, request.url_rule.rule)),
+        mimetype=mimetype,
+        headers=headers,
+    )
+
+
+@api.route("/download/<result_id>")
+def download(result_id):
+    """Stream every variant of a "get all" result.
+
+    A result that is not enumerated yet is not waited for, so no server thread
+    is held meanwhile: the response is a 202 with the progress of its job, whose
+    ``Location`` is the URL to come back to after ``Retry-After`` seconds.
+    Responds with 413 when the result exceeds the enumeration limits.
+
+    Query parameters:
+        format: ``ndjson`` (default) writes one JSON string per line, ``txt`` writes
+            the raw variants one per line and ``compact`` writes a single JSON object
+            describing the variants as combinations of the substitutable slots of the
+            text (see ``CombinationSet.to_compact``), a fraction of the size on long texts.
+        gzip: ``1`` downloads a gzip file. Otherwise the stream is only compressed
+            in transit, if the client accepts it.
+        job: Job of a previous 202 response, set in its ``Location``.
+    """
+    query = results.get(result_id)
+    if query is None:
+        abort(404, description="Unknown or expired result id")
+
+    output_format = request.args.get("format", "ndjson")
+    if output_format not in ("ndjson", "txt", "compact"):
+        abort(400, description="format must be 'ndjson', 'txt' or 'compact'")
+    use_gzip = request.args.get("gzip") == "1"
+
+    # Served from the cache when the full set was already enumerated
+    try:
+        with metrics.timed("get_all_variants"):
+            variants, job = find_all_variants(
+                query["Input"], query["Mode"], request.args.get("job")
+            )
+    except TooManyCombinations as e:
+        abort(413, description=f"Too many combinations: {e}")
+    except WorkersBusy as e:
+        abort(503, description=f"Server busy: {e}")
+    if variants is None:
+        status = job.status()
+        response = jsonify(
+            job=job.id,
+            state=status["state"],
+            processed=status["processed"],
+            total=status["total"],
+            eta=status["eta"],
+        )
+        response.status_code = 202
+        response.headers["Location"] = url_for(
+            "api.download", result_id=result_id, **dict(request.args, job=job.id)
+        )
+        response.headers["Retry-After"] = str(DOWNLOAD_RETRY_AFTER)
+        return response
+    if output_format == "compact":
+        with metrics.timed("serialize"):
+            chunks = iter_chunks([json.dumps(variants.to_compact(), ensure_ascii=False)])
+    else:
+        # Variants are built and serialized by the worker pool
+        chunks = iter_serialized(variants, query["Mode"], output_format)
+
+    text_in = query["Input"]
+    if len(text_in.split()) == 1:
+        filename = re.sub(r"[^\w-]", "_", text_in.strip(), flags=re.ASCII) + "_results"
+    else:
+        filename = "pyleetspeak_results"
+    filename += {"ndjson": ".ndjson", "txt": ".txt", "compact": ".json"}[output_format]
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if use_gzip:
+        return Response(
+            stream_with_context(metrics.metered(gzip_chunks(chunks), request.url_rule.rule)),
+            mimetype="application/gzip",
+            headers=headers,
+        )
+    if output_format == "ndjson":
+        mimetype = "application/x-ndjson"
+    elif output_format == "compact":
+        mimetype = "application/json"
+    else:
+        mimetype = "text/plain"
+    return compressed_response(chunks, mimetype, headers)
+
+
+@api.route("/metrics")
+def metrics_endpoint():
+    """Expose the metrics of this server process in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@api.route("/cache/stats")
+def cache_stats():
+    """Report size and hit/miss counters of the "get all" variants cache."""
+    return jsonify(variants_cache.stats())
+
+
+def _chunked(items, size):
+    for start in range(0, len(items), size):
+        yield start, items[start: start + size]
+
+
+@api.route("/api/batch", methods=["POST"])
+def batch():
+    """Leet many texts in one request.
+
+    The body is either JSON, ``{"items": [...], <shared parameters>}``, or NDJSON
+    (``application/x-ndjson``) with one item per line. Each item is a text or an
+    object with a ``text`` and any parameter overriding the shared ones. Shared
+    parameters can also be given in the query string. Parameters are ``mode``,
+    ``change_prb``, ``change_frq``, ``uniform_change``, ``seed`` (an integer making
+    the random changes reproducible, each item drawing from its own stream
+    derived from the seed and its position), ``n_variants`` (distinct random
+    versions drawn per text, returned as a list when above 1), ``get_all_combs``
+    and ``max_variants`` (variants returned per text in "get all" mode, up to
+    ``LEET_BATCH_MAX_ALL_VARIANTS``). "Get all" texts with more combinations than
+    the page accepts are refused.
+
+    Results are computed by the worker pool and streamed in input order, as NDJSON
+    (default) or as a JSON array with ``?format=json``.
+    """
+    output_format = request.args.get("format", "ndjson")
+    if output_format not in ("ndjson", "json"):
+        abort(400, description="format must be 'ndjson' or 'json'")
+
+    shared = {k: v for k, v in request.args.items() if k in BATCH_DEFAULTS}
+    try:
+        if request.mimetype == "application/x-ndjson":
+            raw_items = [
+                json.loads(line)
+                for line in request.get_data(as_text=True).splitlines()
+                if line.strip()
+            ]
+        else:
+            body = request.get_json(force=True)
+            if not isinstance(body, dict) or not isinstance(body.get("items"), list):
+                raise ValueError("the JSON body must be an object with an 'items' list")
+            shared.update((k, v) for k, v in body.items() if k in BATCH_DEFAULTS)
+            raw_items = body["items"]
+    except ValueError as e:
+        abort(400, description=f"Invalid request body: {e}")
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        abort(400, description=f"Too many items, the maximum is {BATCH_MAX_ITEMS}")
+
+    defaults = dict(BATCH_DEFAULTS)
+    defaults.update(shared)
+    items = []
+    for i, raw in enumerate(raw_items):
+        try:
+            items.append(validate_item(raw, defaults))
+        except (TypeError, ValueError) as e:
+            abort(400, description=f"Item {i}: {e}")
+
+    def generate():
+        start = time.perf_counter()
+        index = 0
+        if output_format == "json":
+            yield "["
+        for chunk_results in imap_ordered(leet_chunk, _chunked(items, BATCH_CHUNK_SIZE)):
+            with metrics.timed("serialize"):
+                records = []
+                for output in chunk_results:
+                    record = json.dumps(
+                        {"index": index, "text": items[index]["text"], "output": output},
+                        ensure_ascii=False,
+                    )
+                    if output_format == "json":
+                        records.append(("," if index else "") + record)
+                    else:
+                        records.append(record + "\n")
+                    index += 1
+            yield from records
+        if output_format == "json":
+            yield "]"
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="batch")
+
+    mimetype = "application/json" if output_format == "json" else "application/x-ndjson"
+    return compressed_response(iter_chunks(generate()), mimetype)
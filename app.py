@@ -1,12 +1,36 @@
 import os
-import json
+import sys
+import random
 import dash
-from dash import dcc, html
+from dash import dash_table, dcc, html
 from dash.dependencies import Output, Input, State, ALL
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
 
-from pyleetspeak import LeetSpeaker
+import metrics
+import serving
+from api import api
+from leet_engine import MODES, format_count, get_engine, warm_up
+from jobs import MAX_COMBINATIONS, TooManyCombinations, WorkersBusy, jobs
+from preview import previewer
+from result_store import (
+    get_variants_page,
+    normalize_query,
+    random_variants_cached,
+    results,
+    variants_cache,
+)
+
+# Number of "get all" variants shown per page
+RESULTS_PAGE_SIZE = 50
+# Pages reachable in the results table, huge combination spaces are cut there
+MAX_RESULT_PAGES = 10 ** 9
+# Maximum number of variants drawn in "Sample K unique variants" mode
+SAMPLE_MAX_K = 1000
+# Maximum number of variants drawn at once in "Random Change" mode
+RANDOM_MAX_VARIANTS = 1000
+# Milliseconds between two polls of a running "get all" job
+JOB_POLL_INTERVAL = 500
 
 # external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -22,9 +46,15 @@ app.title = "LeetSpeaker"
 app._favicon = "./assets/favicon.ico"
 
 server = app.server
+server.register_blueprint(api)
+metrics.init_app(server)
+serving.init_app(app)
+
+# Prepare the leetspeak engine of every mode once per process
+warm_up()
 
 pyleetspeak_img = html.Img(
-    src="./assets/Logo-LeetSpeaker-oscuro-cropped.png",
+    src=serving.asset_url(app, "Logo-LeetSpeaker-oscuro-cropped.png"),
     alt="pyLeetSpeak Logo",
     # width="5",
     style={
@@ -41,7 +71,7 @@ pyleetspeak_img = html.Img(
 )
 
 aida_img = html.Img(
-    src="./assets/aida_logo.png",
+    src=serving.asset_url(app, "aida_logo.png"),
     alt="AI+DA Logo",
     # width="5",
     style={
@@ -127,6 +157,7 @@ radioitems = html.Div(
             options=[
                 {"label": "Random Change", "value": 1},
                 {"label": "Get all possible changes", "value": 2},
+                {"label": "Sample K unique variants", "value": 3},
             ],
             value=1,
             id="radioitems-input",
@@ -143,7 +174,7 @@ dropdown_mode_selection = html.Div(
                 dbc.InputGroupText("Mode"),
                 dbc.Select(
                     id="dropdown-mode",
-                    options=[{"label": i, "value": i} for i in ["Basic", "Intermediate", "Advanced", "COVID_basic", "COVID_intermediate"]],
+                    options=[{"label": i, "value": i} for i in MODES],
                     value="Basic",
                 ),
             ],
@@ -357,6 +388,141 @@ Usually, the same substitution character is used in all the matches for a specif
 
 
 
+draw_selection = html.Div(
+    [
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.Label(
+                        "Select how many different random variants are drawn at once",
+                    ),
+                    width={"size": 6, "offset": 0},
+                    align="center",
+                ),
+                dbc.Col(
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupText("N"),
+                            dbc.Input(
+                                id={"type": "change-slider", "index": 4},
+                                type="number",
+                                min=1,
+                                max=RANDOM_MAX_VARIANTS,
+                                step=1,
+                                value=1,
+                            ),
+                        ],
+                    ),
+                ),
+            ],
+            className="g-0 mb-3",
+        ),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.Label(
+                        "Set a seed to always get the same result for the same text and parameters",
+                    ),
+                    width={"size": 6, "offset": 0},
+                    align="center",
+                ),
+                dbc.Col(
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupText("Seed (optional)"),
+                            dbc.Input(
+                                id={"type": "change-slider", "index": 5},
+                                type="number",
+                                step=1,
+                                value=None,
+                            ),
+                        ],
+                    ),
+                ),
+            ],
+            className="g-0 mb-3",
+        ),
+    ]
+)
+
+
+sample_selection = html.Div(
+    [
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.Label(
+                        "Select how many different variants are drawn from all the possible changes",
+                    ),
+                    width={"size": 6, "offset": 0},
+                    align="center",
+                ),
+                dbc.Col(
+                    dbc.Button(
+                        children=[
+                            "More info",
+                            html.I(
+                                className="fa fa-info-circle",
+                                style={"margin-left": "0.5em"},
+                            ),
+                        ],
+                        id="popover-sample",
+                        outline=True,
+                        color="info",
+                    ),
+                    width={"offset": 0},  # X-axis
+                    style={"margin-bottom": "1.2em", "height": "1.8em"},  # Y-axis
+                    align="center",
+                ),
+                dbc.Popover(
+                    """
+                    The variants are drawn uniformly at random among all the possible changes, without generating them all.
+                    Set a seed to always draw the same variants for the same text and mode.
+                    """,
+                    body=True,
+                    target="popover-sample",
+                    trigger="hover",
+                    style={"max-width": "50em"},
+                ),
+            ],
+            className="g-0",
+        ),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupText("K"),
+                            dbc.Input(
+                                id={"type": "sample-param", "index": 1},
+                                type="number",
+                                min=1,
+                                max=SAMPLE_MAX_K,
+                                step=1,
+                                value=10,
+                            ),
+                        ],
+                    ),
+                ),
+                dbc.Col(
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupText("Seed (optional)"),
+                            dbc.Input(
+                                id={"type": "sample-param", "index": 2},
+                                type="number",
+                                step=1,
+                                value=None,
+                            ),
+                        ],
+                    ),
+                ),
+            ],
+            className="mb-3",
+        ),
+    ]
+)
+
 
 input_text = html.Div(
     [
@@ -368,6 +534,16 @@ input_text = html.Div(
             value=None,
             # style={'width': '100%', 'height': 100},
         ),
+        dbc.Checklist(
+            options=[{"label": "Live preview of the random change", "value": True}],
+            value=[],
+            id="live-preview",
+            switch=True,
+            className="mt-2",
+        ),
+        html.Div(id="live-preview-output", className="text-muted"),
+        # Numbered preview requests of this page, see preview.py
+        dcc.Store(id="preview-request"),
         html.Br(),
         dbc.Button("Submit", id="submit-button", type="submit"),
     ]
@@ -379,8 +555,28 @@ form = dbc.Form(
         radioitems,
         html.Br(),
         dropdown_mode_selection,
-        # It will show sliders depending on the radioitem selection
-        dbc.Row([dbc.Col(id="sliders_selection", children=[])]),
+        # Number of combinations of the current text, updated as the user types
+        html.Div(id="combinations-estimate"),
+        # Every option's form is rendered once, the radioitem selection only shows one
+        dbc.Row(
+            [
+                dbc.Col(
+                    id="sliders_selection",
+                    children=[
+                        dbc.Form(
+                            [html.Br(), change_prb_slider, html.Br(), change_frq_slider, html.Br(), html.Br(), uniform_selection, draw_selection, html.Hr(), html.Br()],
+                            id="random-form",
+                        ),
+                        dbc.Form(
+                            [html.Br(), sample_selection, html.Hr(), html.Br()],
+                            id="sample-form",
+                            style={"display": "none"},
+                        ),
+                        html.Div([html.Hr(), html.Br()], id="all-form", style={"display": "none"}),
+                    ],
+                )
+            ]
+        ),
     ]
 )
 
@@ -481,8 +677,10 @@ layout = dbc.Container(
         # input_text,
         # html.Div(id="leetspeak-output"),
         body,
+        # Id of the current "get all" result, the results themselves stay on the server
         dcc.Store(id="all-output"),
-        dcc.Store(id="input-text"),
+        # Id of the "get all" job of the page, if it has one
+        dcc.Store(id="job-id"),
         dbc.Container(
             footer,
             style={
@@ -500,141 +698,464 @@ layout = dbc.Container(
 app.layout = layout
 
 
+# Show the form of the selected option in the browser, without a server round trip
+app.clientside_callback(
+    """
+    function(radioitems_value) {
+        var hidden = {"display": "none"};
+        // Random change (1), sampling (3), otherwise get all
+        return [
+            radioitems_value === 1 ? {} : hidden,
+            radioitems_value === 3 ? {} : hidden,
+            radioitems_value !== 1 && radioitems_value !== 3 ? {} : hidden,
+        ];
+    }
+    """,
+    [
+        Output("random-form", "style"),
+        Output("sample-form", "style"),
+        Output("all-form", "style"),
+    ],
+    Input("radioitems-input", "value"),
+)
+
+
+# Number every change to preview, the server drops the requests superseded by newer ones
+app.clientside_callback(
+    """
+    function(text, live, mode, radioitems_value, sliders_values, request) {
+        var enabled = Boolean(live && live.length && radioitems_value === 1 && text);
+        // Without preview, the server is only told once, to clear it
+        if (!enabled && !(request && request.enabled)) {
+            return window.dash_clientside.no_update;
+        }
+        return {
+            session: request
+                ? request.session
+                : Math.random().toString(36).slice(2) + Date.now().toString(36),
+            seq: request ? request.seq + 1 : 1,
+            enabled: enabled,
+        };
+    }
+    """,
+    Output("preview-request", "data"),
+    [
+        Input("leet-input", "value"),
+        Input("live-preview", "value"),
+        Input("dropdown-mode", "value"),
+        Input("radioitems-input", "value"),
+        Input({"type": "change-slider", "index": ALL}, "value"),
+    ],
+    State("preview-request", "data"),
+)
+
+
 @app.callback(
-    Output("sliders_selection", "children"), Input("radioitems-input", "value")
+    Output("live-preview-output", "children"),
+    Input("preview-request", "data"),
+    [
+        State("leet-input", "value"),
+        State("dropdown-mode", "value"),
+        State({"type": "change-slider", "index": ALL}, "value"),
+    ],
 )
-def display_sliders(radioitems_value):
-    # Check if sentiment analysis has been selected to display langauges available
-    if (
-        radioitems_value != None and radioitems_value == 1
-    ):  # if random change has been selected
-        sliders = (
-            dbc.Form(
-                [html.Br(), change_prb_slider, html.Br(), change_frq_slider, html.Br(), html.Br(), uniform_selection, html.Hr(), html.Br()],
-                # row=True,
-            ),
+def live_preview(request, text_in, mode, sliders_values):
+    if not request:
+        raise PreventUpdate
+    if not request["enabled"]:
+        previewer.supersede(request["session"], request["seq"])
+        return None
+    change_prb, change_frq, uniform_change, _, seed = sliders_values
+    res = previewer.preview(
+        request["session"], request["seq"], text_in, mode,
+        change_prb, change_frq, uniform_change, seed,
+    )
+    if res is None:
+        # A newer request of the page is on its way
+        raise PreventUpdate
+    return html.P(res, className="mt-2 mb-0")
+
+
+@app.callback(
+    Output("combinations-estimate", "children"),
+    [
+        Input("leet-input", "value"),
+        Input("dropdown-mode", "value"),
+        Input("radioitems-input", "value"),
+    ],
+)
+def estimate_combinations(text_in, mode, radioitems_value):
+    # Only relevant when all the possible changes are requested or sampled
+    if not text_in or radioitems_value not in (2, 3):
+        return None
+    with metrics.timed("count_combinations"):
+        count, exact = get_engine(mode).count_combinations(text_in)
+    count_text = format_count(count, exact)
+    if count > MAX_COMBINATIONS and radioitems_value == 2:
+        return dbc.Alert(
+            f"This text has {count_text} possible combinations, more than the {MAX_COMBINATIONS:,} "
+            "that can be generated. Shorten the text or use 'Random Change'.",
+            color="warning",
         )
-        return sliders
-    return html.Div([html.Hr(), html.Br()])
+    return dbc.Alert(f"This text has {count_text} possible combinations.", color="info")
 
 
 @app.callback(
     [
         Output("leetspeak-output", "children"),
-        Output("all-output", "data"),  # Store results
-        Output("input-text", "data"),  # Store input text
+        Output("all-output", "data"),  # Store the result id
+        Output("job-id", "data"),
     ],
     [Input("submit-button", "n_clicks")],
     [
         State("leet-input", "value"),
         State("dropdown-mode", "value"),
+        State("radioitems-input", "value"),
         State({"type": "change-slider", "index": ALL}, "value"),
+        State({"type": "sample-param", "index": ALL}, "value"),
+        State("job-id", "data"),
     ],
 )
-def leeter(n_clicks, text_in, mode, sliders_values):
+def leeter(n_clicks, text_in, mode, radioitems_value, sliders_values, sample_values, previous_job_id):
 
     if text_in is None:
         raise PreventUpdate
 
-    # Si introducen valores en los sliders estamos en modo cmabio aleatorio
-    elif sliders_values:
-        change_prb, change_frq, uniform_change = sliders_values
-        res = LeetSpeaker(
-            change_prb=change_prb,
-            change_frq=change_frq,
-            mode=mode.lower(),
-            uniform_change=uniform_change,
-            get_all_combs=False,
-        ).text2leet(text_in)
-        return (
-            html.Div([html.Br(), html.H4(f"{res}")]),
-            json.dumps(res),
-            json.dumps(text_in),
+    display_result, result_id, job_id = submit_option(
+        text_in, mode, radioitems_value, sliders_values, sample_values
+    )
+    # The previous job of the page is given up once the new one is submitted, so
+    # submitting the same query again keeps its job running
+    if previous_job_id:
+        jobs.cancel(previous_job_id)
+    return display_result, result_id, job_id
+
+
+def submit_option(text_in, mode, radioitems_value, sliders_values, sample_values):
+    """Run the selected option. Returns the result to show, its result id and its job id."""
+
+    # Modo muestreo: numero de variantes a sacar
+    if radioitems_value == 3:
+        k, seed = sample_values
+        if not k or not 1 <= k <= SAMPLE_MAX_K:
+            return (
+                html.Div(
+                    [
+                        html.Br(),
+                        dbc.Alert(f"K must be between 1 and {SAMPLE_MAX_K}.", color="warning"),
+                    ]
+                ),
+                None,
+                None,
+            )
+        rng = random.Random(seed) if seed is not None else random.Random()
+        with metrics.timed("engine"):
+            engine = get_engine(mode)
+        with metrics.timed("sample"):
+            res = engine.sample_variants(text_in, int(k), rng)
+        metrics.record_variants("sample", len(res))
+        display_result = html.Div(
+            [
+                html.Br(),
+                html.H4(f"Sampled leetspeak variants: {len(res)}"),
+                html.Ol([html.Li(variant) for variant in res]),
+            ]
         )
+        # Nothing to download, so nothing is stored in the session
+        return display_result, None, None
 
-    # Si no introdujeron sliders values es modo get all
+    # Modo cambio aleatorio: valores de los sliders
+    elif radioitems_value == 1:
+        change_prb, change_frq, uniform_change, n, seed = sliders_values
+        if not n or not 1 <= n <= RANDOM_MAX_VARIANTS:
+            return (
+                html.Div(
+                    [
+                        html.Br(),
+                        dbc.Alert(f"N must be between 1 and {RANDOM_MAX_VARIANTS}.", color="warning"),
+                    ]
+                ),
+                None,
+                None,
+            )
+        with metrics.timed("text2leet"):
+            # Seeded results are reproducible, and cached
+            res = random_variants_cached(
+                text_in, mode, int(n), change_prb, change_frq, uniform_change, seed
+            )
+        metrics.record_variants("random", len(res))
+        if n == 1:
+            return html.Div([html.Br(), html.H4(f"{res[0]}")]), None, None
+        display_result = html.Div(
+            [
+                html.Br(),
+                html.H4(f"Random leetspeak variants: {len(res)}"),
+                html.Ol([html.Li(variant) for variant in res]),
+            ]
+        )
+        return display_result, None, None
+
+    # Si no, es modo get all
     else:
-        res = LeetSpeaker(
-            mode=mode.lower(),
-            get_all_combs=True,
-        ).text2leet(text_in)
-
-        # pasamos a json type para poder guardarlo con dcc.Store en la sesion y poder trabajar coon elr esultado
-        total_number_results = len(list(set(res)))
-        res = str(list(set(res)))
-        dict_results = {"Input": text_in, "Output": res}
-        dict_results = json.dumps(dict_results)
-        limit_char_display = 500
-        if len(res) >= limit_char_display:  # limiting the number of printed characterd
-            display_result = html.Div(
-                [
-                    html.Br(),
-                    dbc.Button(
-                        children=[
-                            html.I(
-                                className="fa fa-download",
-                                style={"margin-right": "0.5em"},
-                            ),
-                            " Download",
-                        ],
-                        id="download-result-button",
-                        color="info",
-                        outline=True,
-                        className="mt-1",
+        # Only the result id is stored in the session, results are kept server-side
+        result_id = results.register(text_in, mode)
+        cached = variants_cache.get(normalize_query(text_in, mode))
+        if cached is not None:
+            display_result = render_all_results(
+                result_id, cached[:RESULTS_PAGE_SIZE], len(cached)
+            )
+            return display_result, result_id, None
+
+        # The enumeration runs in the background, the page polls its progress
+        try:
+            with metrics.timed("submit_job"):
+                job = jobs.submit(text_in, mode)
+        except WorkersBusy:
+            return render_busy(), None, None
+        except TooManyCombinations as e:
+            return render_too_many(text_in, mode, str(e)), result_id, None
+
+        display_result = html.Div(
+            [
+                html.Br(),
+                html.Div(render_job_progress(job), id="job-progress-area"),
+                dbc.Button(
+                    children=[
+                        html.I(
+                            className="fa fa-stop-circle",
+                            style={"margin-right": "0.5em"},
+                        ),
+                        " Cancel",
+                    ],
+                    id="cancel-job-button",
+                    color="danger",
+                    outline=True,
+                    className="mt-1",
+                ),
+                dcc.Interval(id="job-poll", interval=JOB_POLL_INTERVAL),
+            ]
+        )
+        return display_result, result_id, job.id
+
+
+def render_all_results(result_id, first_page, total):
+    # Download buttons and the first page of a complete "get all" result
+    return html.Div(
+        [
+            html.Br(),
+            dbc.Button(
+                children=[
+                    html.I(
+                        className="fa fa-download",
+                        style={"margin-right": "0.5em"},
                     ),
-                    dcc.Download(
-                        id="result-file",
-                        # dict(content="Hello world!", filename="hello.txt") #dict(content=str(res), filename=f"{text_in}_leet_results.txt"),
+                    " Download",
+                ],
+                id="download-result-button",
+                href=f"/download/{result_id}?format=txt",
+                external_link=True,
+                color="info",
+                outline=True,
+                className="mt-1",
+            ),
+            dbc.Button(
+                children=[
+                    html.I(
+                        className="fa fa-file-archive-o",
+                        style={"margin-right": "0.5em"},
                     ),
-                    html.P(
-                        f"WARNING! - Truncated output. You can download the {total_number_results} results clicking on the 'Download' button."
+                    " Download (gzip)",
+                ],
+                href=f"/download/{result_id}?format=txt&gzip=1",
+                external_link=True,
+                color="info",
+                outline=True,
+                className="mt-1 ms-2",
+            ),
+            dbc.Button(
+                children=[
+                    html.I(
+                        className="fa fa-file-code-o",
+                        style={"margin-right": "0.5em"},
                     ),
-                    html.P(f"{res[:limit_char_display]} ... "),
-                ]
-            )
+                    " Download (compact)",
+                ],
+                href=f"/download/{result_id}?format=compact",
+                external_link=True,
+                color="info",
+                outline=True,
+                className="mt-1 ms-2",
+            ),
+            html.H4(f"Total leetspeak resuls: {total}"),
+            render_results_table(first_page, total),
+        ]
+    )
+
+
+def render_results_table(first_page, total):
+    # Only the visible page of variants is sent, the others are fetched when paging
+    page_count = min(-(-total // RESULTS_PAGE_SIZE), MAX_RESULT_PAGES)
+    return dash_table.DataTable(
+        id="leetspeak-table",
+        columns=[
+            {"name": "#", "id": "index"},
+            {"name": "Leetspeak result", "id": "variant"},
+        ],
+        data=results_page_records(first_page, 0),
+        page_current=0,
+        page_size=RESULTS_PAGE_SIZE,
+        page_count=max(page_count, 1),
+        page_action="custom",
+        style_as_list_view=True,
+        style_header={"backgroundColor": "transparent", "fontWeight": "bold"},
+        style_cell={
+            "backgroundColor": "transparent",
+            "color": "inherit",
+            "textAlign": "left",
+            "whiteSpace": "pre-wrap",
+        },
+        style_cell_conditional=[{"if": {"column_id": "index"}, "width": "5em"}],
+    )
+
+
+def results_page_records(variants, page):
+    return [
+        {"index": page * RESULTS_PAGE_SIZE + i + 1, "variant": variant}
+        for i, variant in enumerate(variants)
+    ]
+
+
+def render_too_many(text_in, mode, message):
+    # Too many combinations to get them all, pages of variants can still be browsed
+    total, _ = get_engine(mode).count_combinations(text_in)
+    return html.Div(
+        [
+            html.Br(),
+            dbc.Alert(
+                f"Too many combinations: {message}. They cannot be downloaded, but you can "
+                "browse them or use 'Random Change' to get random leetspeak versions of this text.",
+                color="warning",
+            ),
+            render_results_table(get_variants_page(text_in, mode, 0, RESULTS_PAGE_SIZE), total),
+        ]
+    )
+
+
+def render_busy():
+    return html.Div(
+        [
+            html.Br(),
+            dbc.Alert(
+                "The server is busy generating other results, please try again in a moment.",
+                color="danger",
+            ),
+        ]
+    )
+
+
+def render_expired():
+    return dbc.Alert(
+        "The results of this request are no longer available, please submit it again.",
+        color="warning",
+    )
+
+
+def render_job_progress(job):
+    # Progress bar, ETA and the variants produced so far by a running job
+    status = job.status()
+    progress = 100 * status["processed"] / status["total"] if status["total"] else 0
+    if status["state"] == "queued":
+        eta_text = "waiting for a free worker"
+    elif status["eta"] is None:
+        eta_text = "estimating time left"
+    else:
+        eta_text = f"about {status['eta']:.0f} s left"
+    return html.Div(
+        [
+            dbc.Progress(value=progress, label=f"{progress:.0f}%", striped=True, animated=True),
+            html.P(
+                f"{status['produced']:,} leetspeak results generated so far ({eta_text})",
+                className="mt-2",
+            ),
+            html.Ol([html.Li(variant) for variant in job.variants(0, RESULTS_PAGE_SIZE)]),
+        ]
+    )
+
+
+@app.callback(
+    [
+        Output("job-progress-area", "children"),
+        Output("job-poll", "disabled"),
+        Output("cancel-job-button", "style"),
+    ],
+    Input("job-poll", "n_intervals"),
+    [
+        State("job-id", "data"),
+        State("all-output", "data"),
+    ],
+)
+def poll_job(n_intervals, job_id, result_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return render_expired(), True, {"display": "none"}
+
+    status = job.status()
+    if status["state"] in ("queued", "running"):
+        return render_job_progress(job), False, {}
+    if status["state"] == "done":
+        display_result = render_all_results(
+            result_id, job.variants(0, RESULTS_PAGE_SIZE), status["produced"]
+        )
+    elif status["state"] == "cancelled":
+        display_result = dbc.Alert("The generation of the results was cancelled.", color="info")
+    else:
+        query = results.get(result_id)
+        if query is None:
+            display_result = render_expired()
         else:
-            display_result = html.Div(
-                [
-                    html.Br(),
-                    dbc.Button(
-                        children=[
-                            html.I(
-                                className="fa fa-download",
-                                style={"margin-right": "0.5em"},
-                            ),
-                            " Download",
-                        ],
-                        id="download-result-button",
-                        color="info",
-                        outline=True,
-                        className="mt-1",
-                    ),
-                    dcc.Download(
-                        id="result-file",
-                    ),
-                    html.H4(f"Total leetspeak resuls: {total_number_results}"),
-                    html.H4(f"{res}"),
-                ]
-            )
-        return display_result, dict_results, json.dumps(text_in)
+            display_result = render_too_many(query["Input"], query["Mode"], status["error"])
+    return display_result, True, {"display": "none"}
 
 
 @app.callback(
-    Output("result-file", "data"),
     [
-        Input("download-result-button", "n_clicks"),
-        Input("all-output", "data"),
-        Input("input-text", "data"),
+        Output("cancel-job-button", "children"),
+        Output("cancel-job-button", "disabled"),
     ],
+    Input("cancel-job-button", "n_clicks"),
+    State("job-id", "data"),
     prevent_initial_call=True,
 )
-def download(n_cliks, dict_results, text_in):
-    if n_cliks:
-        if len(text_in.split()) == 1:
-            return dict(content=dict_results, filename=f"{text_in}_results.txt")
-        else:
-            return dict(content=dict_results, filename=f"pyleetspeak_results.txt")
+def cancel_job(n_clicks, job_id):
+    jobs.cancel(job_id)
+    return "Cancelling...", True
+
+
+@app.callback(
+    Output("leetspeak-table", "data"),
+    Input("leetspeak-table", "page_current"),
+    State("all-output", "data"),
+    prevent_initial_call=True,
+)
+def change_results_page(page_current, result_id):
+    # Fetch only the visible page of variants
+    query = results.get(result_id)
+    if query is None or page_current is None:
+        raise PreventUpdate
+    start = page_current * RESULTS_PAGE_SIZE
+    with metrics.timed("page"):
+        page = get_variants_page(query["Input"], query["Mode"], start, start + RESULTS_PAGE_SIZE)
+    return results_page_records(page, page_current)
 
 
 if __name__ == "__main__":
-    app.run_server(debug=True, host='0.0.0.0', port='8501',use_reloader=True)
+    if "--production" in sys.argv[1:]:
+        # Same as: gunicorn -c gunicorn.conf.py app:server
+        from gunicorn.app.wsgiapp import run
+
+        config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+        sys.argv = [sys.argv[0], "-c", config]
+        run()
+    else:
+        # Development server, with the debugger and reloader
+        app.run_server(debug=True, host='0.0.0.0', port='8501',use_reloader=True)
@@ -0,0 +1,576 @@
+"""Benchmarks of the leetspeak paths of the app.
+
+Drives the Dash callbacks and ``LeetSpeaker.text2leet`` directly, for inputs of
+growing length, every mode and both ``get_all_combs`` settings, and reports
+latency percentiles, peak memory, variants per second and payload sizes.
+Results are saved as JSON so two runs can be compared::
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+
+``--wire`` also reports the bytes sent over HTTP for the page, its assets, the
+callbacks and the downloads, uncompressed and with each content encoding.
+
+``--fixed`` compares the throughput of the general random draw and of the
+translation table used when every match is replaced uniformly.
+
+``--load`` measures the latency of a cheap UI callback while other threads of
+the server keep sending heavy "get all" requests, enumerations and downloads,
+as concurrent users would.
+
+``--download-wait`` measures how long a download of a result that is not
+enumerated yet keeps a server thread busy.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from plotly.utils import PlotlyJSONEncoder
+from pyleetspeak import LeetSpeaker
+
+import app
+from jobs import get_all_variants, jobs
+from leet_engine import MODES, get_engine
+
+# Words used to build inputs of growing length
+CORPUS_WORDS = "the quick brown fox jumps over the lazy dog while vaccines fight covid".split()
+# Input lengths, in words
+DEFAULT_LENGTHS = (1, 2, 4, 8, 16)
+# "Get all" inputs with more combinations are skipped, they would not finish
+MAX_BENCH_COMBINATIONS = 200000
+# Random-change parameters used for the random paths (the app defaults)
+RANDOM_PARAMS = {"change_prb": 0.5, "change_frq": 0.5, "uniform_change": True}
+
+
+def make_corpus(lengths):
+    """Inputs of ``length`` words taken cyclically from the corpus words."""
+    return {
+        length: " ".join(CORPUS_WORDS[i % len(CORPUS_WORDS)] for i in range(length))
+        for length in lengths
+    }
+
+
+def payload_size(value):
+    """Size in bytes of a callback return value once serialized by Dash."""
+    return len(json.dumps(value, cls=PlotlyJSONEncoder).encode("utf-8"))
+
+
+def peak_rss_kb():
+    """Peak resident memory of this process and of its finished children, in KB."""
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":  # reported in bytes instead of KB
+        own, children = own // 1024, children // 1024
+    return {"self": own, "children": children}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def measure(func, repeat):
+    """Run ``func`` ``repeat`` times plus a traced run.
+
+    ``func`` returns ``(n_variants, payload_bytes)``.
+    """
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n_variants, payload = func()
+        latencies.append(time.perf_counter() - start)
+
+    # Separate run, tracing allocations slows the code down
+    tracemalloc.start()
+    func()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean = statistics.mean(latencies)
+    return {
+        "repeat": repeat,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p90_ms": 1000 * percentile(latencies, 90),
+        "p99_ms": 1000 * percentile(latencies, 99),
+        "max_ms": 1000 * max(latencies),
+        "mean_ms": 1000 * mean,
+        "variants": n_variants,
+        "variants_per_s": n_variants / mean if mean else None,
+        "payload_bytes": payload,
+        "traced_peak_kb": traced_peak // 1024,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def bench_text2leet(text, mode, get_all_combs):
+    """pyLeetSpeak itself, as the app used it before."""
+
+    def run():
+        if get_all_combs:
+            res = set(LeetSpeaker(mode=mode.lower(), get_all_combs=True).text2leet(text))
+            return len(res), len(json.dumps({"Input": text, "Output": str(list(res))}))
+        res = LeetSpeaker(mode=mode.lower(), get_all_combs=False, **RANDOM_PARAMS).text2leet(text)
+        return 1, len(json.dumps(res))
+
+    return run
+
+
+def bench_engine(text, mode, get_all_combs):
+    """The shared engine of the mode, without any Dash or caching layer."""
+    engine = get_engine(mode)
+
+    def run():
+        if get_all_combs:
+            return sum(1 for _ in engine.iter_all_variants(text)), None
+        return 1, len(json.dumps(engine.text2leet(text, **RANDOM_PARAMS)))
+
+    return run
+
+
+def bench_leeter(text, mode, get_all_combs):
+    """The Submit callback, polling the background job until it ends in "get all" mode."""
+    # Every option's form is in the page, the radioitem value selects the mode
+    radioitems_value = 2 if get_all_combs else 1
+    sliders = list(RANDOM_PARAMS.values()) + [1, None]  # One variant, no seed
+    leeter = app.leeter.__wrapped__
+    poll_job = app.poll_job.__wrapped__
+
+    def run():
+        app.variants_cache.clear()
+        output = leeter(1, text, mode, radioitems_value, sliders, [None, None], None)
+        payload = payload_size(output)
+        n_variants = 1
+        if get_all_combs:
+            _, result_id, job_id = output
+            while job_id is not None:
+                polled = poll_job(0, job_id, result_id)
+                payload += payload_size(polled)
+                if polled[1]:
+                    break
+                time.sleep(0.01)
+            job = jobs.get(job_id) if job_id else None
+            n_variants = job.status()["produced"] if job else 0
+        return n_variants, payload
+
+    return run
+
+
+def download(client, url):
+    """Download a "get all" result, coming back while it is enumerated as a client would.
+
+    Returns:
+        Tuple[bytes, float, float]: The body, and the seconds spent inside requests
+        (during which a server thread is busy) before the body and in total.
+    """
+    held = 0.0
+    while True:
+        start = time.perf_counter()
+        response = client.get(url)
+        waiting = held
+        data = response.get_data()
+        held += time.perf_counter() - start
+        if response.status_code != 202:
+            return data, waiting, held
+        url = response.headers["Location"]
+        time.sleep(0.01)
+
+
+def bench_download(text, mode):
+    """The streamed download of a complete "get all" result."""
+    client = app.server.test_client()
+    result_id = app.results.register(text, mode)
+
+    def run():
+        app.variants_cache.clear()
+        data, _, _ = download(client, f"/download/{result_id}?format=txt")
+        return data.count(b"\n"), len(data)
+
+    return run
+
+
+def leeter_request_body(text, mode, get_all_combs):
+    """Body of the HTTP request Dash sends when Submit is clicked."""
+    sliders = [
+        {"id": {"type": "change-slider", "index": i + 1}, "property": "value", "value": value}
+        for i, value in enumerate(list(RANDOM_PARAMS.values()) + [1, None])
+    ]
+    sample = [
+        {"id": {"type": "sample-param", "index": i + 1}, "property": "value", "value": None}
+        for i in range(2)
+    ]
+    return {
+        "output": "..leetspeak-output.children...all-output.data...job-id.data..",
+        "outputs": [
+            {"id": "leetspeak-output", "property": "children"},
+            {"id": "all-output", "property": "data"},
+            {"id": "job-id", "property": "data"},
+        ],
+        "inputs": [{"id": "submit-button", "property": "n_clicks", "value": 1}],
+        "changedPropIds": ["submit-button.n_clicks"],
+        "state": [
+            {"id": "leet-input", "property": "value", "value": text},
+            {"id": "dropdown-mode", "property": "value", "value": mode},
+            {"id": "radioitems-input", "property": "value", "value": 2 if get_all_combs else 1},
+            sliders,
+            sample,
+            {"id": "job-id", "property": "data", "value": None},
+        ],
+    }
+
+
+def wire_bytes(lengths, modes):
+    """Bytes sent for each kind of response, uncompressed and per content encoding."""
+    client = app.server.test_client()
+    encodings = {"identity": "identity", "gzip": "gzip", "br": "br"}
+
+    def sizes(method, url, **kwargs):
+        record = {}
+        for name, accept in encodings.items():
+            response = client.open(url, method=method, headers={"Accept-Encoding": accept}, **kwargs)
+            record[name] = len(response.get_data())
+        return record
+
+    results = [dict(sizes("GET", "/"), target="index")]
+    for asset in ("Logo-LeetSpeaker-oscuro-cropped.png", "aida_logo.png", "favicon.ico"):
+        results.append(dict(sizes("GET", app.app.get_asset_url(asset)), target=f"asset {asset}"))
+
+    for mode in modes:
+        for length, text in make_corpus(lengths).items():
+            combinations, _ = get_engine(mode).count_combinations(text)
+            for get_all_combs in (False, True):
+                if get_all_combs:
+                    if combinations > MAX_BENCH_COMBINATIONS:
+                        continue
+                    get_all_variants(text, mode)  # Cached, so the callback renders the results
+                body = leeter_request_body(text, mode, get_all_combs)
+                record = sizes("POST", "/_dash-update-component", json=body)
+                record.update(target="leeter", mode=mode, words=length, get_all_combs=get_all_combs)
+                results.append(record)
+                if get_all_combs:
+                    result_id = app.results.register(text, mode)
+                    for output_format in ("txt", "compact"):
+                        record = sizes("GET", f"/download/{result_id}?format={output_format}")
+                        record.update(
+                            target=f"download {output_format}", mode=mode, words=length,
+                            get_all_combs=True,
+                        )
+                        results.append(record)
+    for record in results:
+        name = record["target"]
+        if "mode" in record:
+            name += f" {record['mode']} {record['words']} words {'all' if record['get_all_combs'] else 'rand'}"
+        print(
+            f"{name:<52} identity {record['identity']:>9} B  gzip {record['gzip']:>9} B  "
+            f"br {record['br']:>9} B",
+            flush=True,
+        )
+    return results
+
+
+# Random-change parameters replacing every match, served by the translation table path
+FIXED_PARAMS = {"change_prb": 1.0, "change_frq": 1.0, "uniform_change": True}
+# Calls timed per case of the translation table benchmark
+FIXED_CALLS = 2000
+
+
+def texts_per_second(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return calls / (time.perf_counter() - start)
+
+
+def fixed_throughput(lengths, modes):
+    """Throughput of ``change_prb=1``, ``change_frq=1``, ``uniform_change=True``.
+
+    Compares pyLeetSpeak, the general random draw of the engine and the
+    translation table path the engine uses for these settings.
+    """
+    results = []
+    for mode in modes:
+        engine = get_engine(mode)
+        speaker = LeetSpeaker(mode=mode.lower(), get_all_combs=False, **FIXED_PARAMS)
+        for length, text in make_corpus(lengths).items():
+            # pyLeetSpeak is much slower, fewer calls are enough
+            cases = {
+                "text2leet": (lambda: speaker.text2leet(text), FIXED_CALLS // 10),
+                "general": (
+                    lambda: engine._draw(text, engine._matches(text), rng=random, **FIXED_PARAMS),
+                    FIXED_CALLS,
+                ),
+                "table": (lambda: engine.text2leet(text, **FIXED_PARAMS), FIXED_CALLS),
+            }
+            record = {"mode": mode, "words": length}
+            for name, (func, calls) in cases.items():
+                record[f"{name}_per_s"] = texts_per_second(func, calls)
+            record["speedup"] = record["table_per_s"] / record["general_per_s"]
+            results.append(record)
+            print(
+                f"{mode:<18} {length:>3} words  pyleetspeak {record['text2leet_per_s']:>9,.0f}/s  "
+                f"general {record['general_per_s']:>9,.0f}/s  table {record['table_per_s']:>9,.0f}/s  "
+                f"{record['speedup']:5.1f}x",
+                flush=True,
+            )
+    return results
+
+
+# Text and mode of the heavy "get all" requests of the load benchmark
+LOAD_QUERY = ("aa ee vv", "COVID_intermediate")
+# Cheap callbacks timed per load level
+LOAD_SAMPLES = 100
+
+
+def cheap_callback_latencies(client, n):
+    """Latencies of the callback showing the number of combinations of a short text."""
+    body = {
+        "output": "combinations-estimate.children",
+        "outputs": {"id": "combinations-estimate", "property": "children"},
+        "inputs": [
+            {"id": "leet-input", "property": "value", "value": "hello"},
+            {"id": "dropdown-mode", "property": "value", "value": "Basic"},
+            {"id": "radioitems-input", "property": "value", "value": 2},
+        ],
+        "changedPropIds": ["leet-input.value"],
+    }
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client.post("/_dash-update-component", json=body).get_data()
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    return latencies
+
+
+def heavy_load(stop):
+    """Keep requesting a large "get all" result and downloading it until ``stop`` is set."""
+    client = app.server.test_client()
+    text, mode = LOAD_QUERY
+    result_id = app.results.register(text, mode)
+    body = leeter_request_body(text, mode, True)
+    while not stop.is_set():
+        app.variants_cache.clear()  # Enumerate it again each time
+        client.post("/_dash-update-component", json=body).get_data()
+        download(client, f"/download/{result_id}?format=ndjson")
+
+
+def load_latencies(heavy_threads, samples):
+    """p50/p99 latency of a cheap callback, idle and with ``heavy_threads`` heavy users."""
+    client = app.server.test_client()
+    client.get("/")  # Let Dash set up its routes
+    cheap_callback_latencies(client, 5)  # Warm up
+    report = {"idle": cheap_callback_latencies(client, samples)}
+    stop = threading.Event()
+    threads = [threading.Thread(target=heavy_load, args=(stop,)) for _ in range(heavy_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1)
+    try:
+        report["loaded"] = cheap_callback_latencies(client, samples)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    results = {}
+    for name, latencies in report.items():
+        results[name] = {
+            "p50_ms": 1000 * percentile(latencies, 50),
+            "p99_ms": 1000 * percentile(latencies, 99),
+            "max_ms": 1000 * max(latencies),
+        }
+        print(
+            f"cheap callback, {name:<6} p50 {results[name]['p50_ms']:8.2f} ms  "
+            f"p99 {results[name]['p99_ms']:8.2f} ms  max {results[name]['max_ms']:8.2f} ms",
+            flush=True,
+        )
+    results["heavy_threads"] = heavy_threads
+    return results
+
+
+def download_hold(repeat):
+    """Seconds a server thread is busy per download of a result not enumerated yet.
+
+    Compares waiting for the enumeration inside the request, as the download
+    route used to, with the 202 responses it gives now.
+    """
+    client = app.server.test_client()
+    text, mode = LOAD_QUERY
+    result_id = app.results.register(text, mode)
+    url = f"/download/{result_id}?format=txt"
+    report = {}
+    for name in ("wait", "poll"):
+        times = {"waiting_s": [], "held_s": [], "wall_s": []}
+        for _ in range(repeat):
+            app.variants_cache.clear()
+            start = time.perf_counter()
+            if name == "wait":
+                get_all_variants(text, mode)
+                waiting = time.perf_counter() - start
+                client.get(url).get_data()
+                held = time.perf_counter() - start
+            else:
+                _, waiting, held = download(client, url)
+            times["waiting_s"].append(waiting)
+            times["held_s"].append(held)
+            times["wall_s"].append(time.perf_counter() - start)
+        report[name] = {key: statistics.median(values) for key, values in times.items()}
+        print(
+            f"download {name:<4} thread busy {report[name]['held_s']:7.3f} s, "
+            f"{report[name]['waiting_s']:7.3f} s of it before the body, "
+            f"{report[name]['wall_s']:7.3f} s until the last byte",
+            flush=True,
+        )
+    return report
+
+
+def run_benchmarks(lengths, modes, repeat, targets):
+    corpus = make_corpus(lengths)
+    results = []
+    for mode in modes:
+        engine = get_engine(mode)
+        for length, text in corpus.items():
+            combinations, _ = engine.count_combinations(text)
+            for get_all_combs in (False, True):
+                cases = {
+                    "text2leet": lambda: bench_text2leet(text, mode, get_all_combs),
+                    "engine": lambda: bench_engine(text, mode, get_all_combs),
+                    "leeter": lambda: bench_leeter(text, mode, get_all_combs),
+                }
+                if get_all_combs:
+                    cases["download"] = lambda: bench_download(text, mode)
+                for target, make_case in cases.items():
+                    if target not in targets:
+                        continue
+                    record = {
+                        "target": target,
+                        "mode": mode,
+                        "words": length,
+                        "chars": len(text),
+                        "get_all_combs": get_all_combs,
+                        "combinations": combinations,
+                    }
+                    if get_all_combs and combinations > MAX_BENCH_COMBINATIONS:
+                        record["skipped"] = f"more than {MAX_BENCH_COMBINATIONS} combinations"
+                    else:
+                        record.update(measure(make_case(), repeat))
+                    results.append(record)
+                    print(format_record(record), flush=True)
+    return results
+
+
+def format_record(record):
+    name = (
+        f"{record['target']:<9} {record['mode']:<18} {record['words']:>3} words "
+        f"{'all ' if record['get_all_combs'] else 'rand'}"
+    )
+    if "skipped" in record:
+        return f"{name}  skipped ({record['skipped']})"
+    rate = record["variants_per_s"]
+    return (
+        f"{name}  p50 {record['p50_ms']:9.2f} ms  p99 {record['p99_ms']:9.2f} ms  "
+        f"{record['variants']:>7} variants  {rate or 0:>11,.0f} var/s  "
+        f"{record['payload_bytes'] or 0:>9} B  traced peak {record['traced_peak_kb']:>7} KB"
+    )
+
+
+def record_key(record):
+    return (record["target"], record["mode"], record["words"], record["get_all_combs"])
+
+
+def compare(results, previous_path):
+    """Print the p50 latency ratio of each case against a previous run."""
+    with open(previous_path) as f:
+        previous = {record_key(r): r for r in json.load(f)["results"] if "skipped" not in r}
+    print(f"\nComparison with {previous_path} (p50 new / old, < 1 is faster)")
+    for record in results:
+        old = previous.get(record_key(record))
+        if "skipped" in record or old is None or not old["p50_ms"]:
+            continue
+        ratio = record["p50_ms"] / old["p50_ms"]
+        flag = "  REGRESSION" if ratio > 1.2 else ""
+        print(f"{format_record(record)[:48]}  {ratio:6.2f}x{flag}")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write")
+    parser.add_argument("--compare", help="previous JSON results to compare with")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case")
+    parser.add_argument(
+        "--lengths", type=int, nargs="+", default=DEFAULT_LENGTHS, help="input lengths in words"
+    )
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument(
+        "--targets",
+        nargs="+",
+        default=["text2leet", "engine", "leeter", "download"],
+        choices=["text2leet", "engine", "leeter", "download"],
+    )
+    parser.add_argument("--wire", action="store_true", help="also report bytes on the wire")
+    parser.add_argument(
+        "--load", type=int, metavar="THREADS", help="also measure a cheap callback under load"
+    )
+    parser.add_argument(
+        "--fixed", action="store_true", help="also measure the translation table path"
+    )
+    parser.add_argument(
+        "--download-wait", action="store_true",
+        help="also measure the server time held by downloads of results being enumerated",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.lengths, args.modes, args.repeat, set(args.targets))
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.wire:
+        print("\nBytes on the wire")
+        report["wire"] = wire_bytes(args.lengths, args.modes)
+    if args.load:
+        print(f"\nCheap callback latency with {args.load} threads of heavy requests")
+        report["load"] = load_latencies(args.load, LOAD_SAMPLES)
+    if args.fixed:
+        print("\nEvery match replaced, uniform change (texts per second)")
+        report["fixed"] = fixed_throughput(args.lengths, args.modes)
+    if args.download_wait:
+        print("\nDownload of a result being enumerated (median)")
+        report["download_wait"] = download_hold(args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
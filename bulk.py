@@ -0,0 +1,194 @@
+"""Leet large text files offline, one output per input line.
+
+Items follow the semantics of the batch API (``/api/batch``): the same modes,
+parameters and defaults. In a seeded run each line draws from its own stream,
+derived from the seed and the line number, so a file gives the same outputs as
+a batch request of its lines with the same seed::
+
+    python bulk.py corpus.txt corpus_leet.txt --mode Advanced --seed 42
+    python bulk.py corpus.txt corpus_leet.ndjson --format ndjson --n-variants 5
+
+The input is streamed and cut into shards of ``--shard-lines`` lines, leeted
+by the worker pool and written in input order. After each shard the output is
+flushed and a checkpoint (``<output>.checkpoint``) records how far the input
+and output went, so running the same command again after an interruption
+resumes from the last finished shard. The checkpoint is deleted at the end.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+
+# Lines leeted by a pool process at once, and between two checkpoints
+DEFAULT_SHARD_LINES = 10000
+# Bytes read from the input at once
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+def read_shards(path, offset, shard_lines):
+    """Stream the lines of a file from a byte offset, ``shard_lines`` at a time.
+
+    Yields:
+        Tuple[List[str], int]: The lines of a shard, without line endings, and the
+        byte offset of the input after it.
+    """
+    with open(path, "rb", buffering=READ_BUFFER_SIZE) as f:
+        f.seek(offset)
+        lines = []
+        for line in f:
+            offset += len(line)
+            lines.append(line.rstrip(b"\r\n").decode("utf-8"))
+            if len(lines) == shard_lines:
+                yield lines, offset
+                lines = []
+        if lines:
+            yield lines, offset
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    # Write then rename, so an interruption never leaves a partial checkpoint
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def format_output(index, text, output, output_format):
+    if output_format == "ndjson":
+        record = {"index": index, "text": text, "output": output}
+        return json.dumps(record, ensure_ascii=False) + "\n"
+    return output + "\n"
+
+
+def run(args, params):
+    from workers import imap_ordered, leet_texts
+
+    checkpoint_path = args.output + ".checkpoint"
+    job = {
+        "input": os.path.abspath(args.input),
+        "input_size": os.path.getsize(args.input),
+        "params": params,
+        "format": args.format,
+    }
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        if {key: checkpoint.get(key) for key in job} != job:
+            sys.exit(
+                f"{checkpoint_path} belongs to another input or other parameters, "
+                "use --restart to start over"
+            )
+        print(f"Resuming after line {checkpoint['lines']:,}", file=sys.stderr)
+    else:
+        checkpoint = dict(job, input_offset=0, output_offset=0, lines=0)
+    resumed_lines = checkpoint["lines"]
+
+    # Shards sent to the pool, whose output is not written yet
+    pending = deque()
+
+    def tasks():
+        # Seeded lines draw from a stream of their line number, see workers.leet_item
+        index = checkpoint["lines"]
+        for lines, input_offset in read_shards(
+            args.input, checkpoint["input_offset"], args.shard_lines
+        ):
+            pending.append((lines, input_offset))
+            yield params, index, lines
+            index += len(lines)
+
+    start = time.perf_counter()
+    with open(args.output, "r+b" if checkpoint["output_offset"] else "wb") as output:
+        # Drop whatever was written after the last checkpoint
+        output.truncate(checkpoint["output_offset"])
+        output.seek(checkpoint["output_offset"])
+        for outputs in imap_ordered(leet_texts, tasks()):
+            lines, input_offset = pending.popleft()
+            index = checkpoint["lines"]
+            output.write(
+                "".join(
+                    format_output(index + i, text, out, args.format)
+                    for i, (text, out) in enumerate(zip(lines, outputs))
+                ).encode("utf-8")
+            )
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint["input_offset"] = input_offset
+            checkpoint["output_offset"] = output.tell()
+            checkpoint["lines"] += len(lines)
+            save_checkpoint(checkpoint_path, checkpoint)
+            rate = (index + len(lines) - resumed_lines) / (time.perf_counter() - start)
+            print(f"{checkpoint['lines']:,} lines ({rate:,.0f} lines/s)", file=sys.stderr)
+    # An empty input never wrote any checkpoint
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(checkpoint_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("input", help="UTF-8 text file, one text per line")
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("--format", default="txt", choices=("txt", "ndjson"))
+    parser.add_argument("--mode", help="leetspeak mode (Basic)")
+    parser.add_argument("--change-prb", type=float, help="probability of each substitution type")
+    parser.add_argument("--change-frq", type=float, help="frequency of each applied substitution")
+    parser.add_argument(
+        "--uniform-change", choices=("yes", "no"), help="same substitution for every match"
+    )
+    parser.add_argument("--seed", type=int, help="seed making the outputs reproducible")
+    parser.add_argument("--n-variants", type=int, help="distinct random versions per line")
+    parser.add_argument(
+        "--get-all", action="store_true", help="output the distinct variants of each line"
+    )
+    parser.add_argument("--max-variants", type=int, help="variants per line with --get-all")
+    parser.add_argument(
+        "--shard-lines", type=int, default=DEFAULT_SHARD_LINES, help="lines per shard"
+    )
+    parser.add_argument("--processes", type=int, help="pool processes (one per core)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    if args.processes:
+        # Read by workers.py when it is first imported
+        os.environ["LEET_WORKER_PROCESSES"] = str(args.processes)
+    from params import BATCH_DEFAULTS, validate_item
+
+    options = {
+        "mode": args.mode,
+        "change_prb": args.change_prb,
+        "change_frq": args.change_frq,
+        "uniform_change": args.uniform_change,
+        "seed": args.seed,
+        "n_variants": args.n_variants,
+        "get_all_combs": args.get_all or None,
+        "max_variants": args.max_variants,
+    }
+    defaults = dict(BATCH_DEFAULTS)
+    defaults.update((name, value) for name, value in options.items() if value is not None)
+    try:
+        params = validate_item("", defaults)
+    except (TypeError, ValueError) as e:
+        parser.error(str(e))
+    del params["text"]
+    if args.format == "txt" and (params["get_all_combs"] or params["n_variants"] > 1):
+        parser.error("several outputs per line need --format ndjson")
+    try:
+        run(args, params)
+    except KeyboardInterrupt:
+        sys.exit("Interrupted, run the same command again to resume")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""gunicorn configuration of the production server.
+
+Run it with ``python app.py --production`` or::
+
+    gunicorn -c gunicorn.conf.py app:server
+
+CPU-heavy leetspeak work (enumerations and batches) runs in the process pool
+of each web worker, so web workers only render callbacks and stream responses,
+which threads handle well. "Get all" jobs, their progress and the result
+caches live in the web worker that started them. A single web worker is the
+default because several of them would each need sticky sessions and a shared
+``LEET_RESULT_DIR``. The pool processes are split between the web workers so
+that together they use every core once.
+
+Settings can be overridden with environment variables:
+    PORT: Port to listen on (8501).
+    LEET_WEB_WORKERS: Web worker processes (1).
+    LEET_WEB_THREADS: Threads per web worker (twice the cores, at least 8).
+    LEET_MAX_REQUESTS: Requests served before a worker is replaced, 0 never (0
+        with a single web worker, 10000 with several).
+
+Replacing a web worker drops the jobs, progress and caches it kept in memory,
+and with a single worker its result ids too, unless ``LEET_RESULT_DIR`` is
+set. So a single worker is only recycled when ``LEET_MAX_REQUESTS`` asks for it.
+"""
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+wsgi_app = "app:server"
+bind = f"0.0.0.0:{os.environ.get('PORT', 8501)}"
+
+workers = int(os.environ.get("LEET_WEB_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.environ.get("LEET_WEB_THREADS", 0)) or max(8, 2 * cores)
+# Pool processes per web worker. Read by workers.py when the app is loaded below
+os.environ.setdefault("LEET_WORKER_PROCESSES", str(max(1, cores // workers)))
+
+# Build the app and the leetspeak tables once in the master, workers share them
+# after the fork. The pool processes are only started on first use, in the workers
+preload_app = True
+
+# Replace workers from time to time, so memory kept after large enumerations
+# (allocator fragmentation, caches) cannot grow forever. The jitter keeps
+# several workers from restarting at the same time. A single worker holds every
+# page's state, so it is only replaced on request
+max_requests = int(os.environ.get("LEET_MAX_REQUESTS", 10000 if workers > 1 else 0))
+max_requests_jitter = max_requests // 10
+
+# No request waits for an enumeration: downloads of a result still being
+# enumerated answer 202 at once (see api.download), so the defaults are enough
+timeout = 30
+graceful_timeout = timeout
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def worker_exit(server, worker):
+    # Stop the pool processes with their web worker
+    from workers import shutdown_pool
+
+    shutdown_pool(wait=False)
@@ -0,0 +1,369 @@
+"""Background "get all" enumeration jobs.
+
+A job splits the combinations of a query into ranges that are enumerated by
+the worker pool, and merges the results in order while keeping track of its
+progress, so the page can poll it, show the variants produced so far and
+cancel it. Jobs are bounded in number of variants, memory and time, so a
+single huge input cannot hold the server.
+
+:class:`JobQueue` keeps jobs in memory of the server process. Any object with
+the same ``submit``/``get``/``cancel`` methods (e.g. backed by a database
+shared by several servers) can replace the module-level ``jobs`` queue.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+import weakref
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from leet_engine import CombinationSet, count_combinations, format_count, get_engine
+from params import ENUM_MAX_VARIANTS, MAX_COMBINATIONS
+from result_store import get_variants_page, normalize_query, variants_cache
+from workers import WORKER_PROCESSES, enumerate_range, imap_ordered
+
+# Limits of a "get all" enumeration job, besides params.ENUM_MAX_VARIANTS
+ENUM_MAX_BYTES = int(os.environ.get("LEET_ENUM_MAX_BYTES", 64 * 1024 * 1024))
+ENUM_TIME_LIMIT = float(os.environ.get("LEET_ENUM_TIME_LIMIT", 20))
+# Maximum number of enumeration jobs running or waiting per server process
+ENUM_MAX_QUEUED = int(os.environ.get("LEET_ENUM_MAX_QUEUED", 0)) or 2 * WORKER_PROCESSES
+# Number of combinations enumerated by a pool process at once
+JOB_CHUNK_COMBINATIONS = 20000
+
+
+class TooManyCombinations(Exception):
+    """Raised when a "get all" enumeration exceeds the job limits."""
+
+
+class WorkersBusy(Exception):
+    """Raised when too many enumeration jobs are already waiting for the pool."""
+
+
+class Job(object):
+    """A "get all" enumeration running in the background.
+
+    Attributes:
+        id (str): Opaque job id.
+        state (str): "queued", "running", "done", "failed" or "cancelled".
+        total (int): Number of combinations to go through.
+        processed (int): Number of combinations already gone through.
+        produced (int): Number of distinct variants found so far.
+        error (str): Why the job failed, if it did.
+        result (CombinationSet): The distinct variants found so far. None once the
+            job ended: a done job hands them to ``variants_cache``, so finished jobs
+            kept for polling do not hold memory outside the cache limits.
+    """
+
+    def __init__(self, text, mode):
+        self.id = uuid.uuid4().hex
+        self.key = normalize_query(text, mode)
+        self.state = "queued"
+        text, slots = get_engine(self.key[1]).find_slots(self.key[0])
+        self.total, exact = count_combinations(slots)
+        self.processed = 0
+        self.produced = 0
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        # Only combinations of slots with choices of different lengths can repeat a
+        # variant. Otherwise every combination is kept and there is nothing to enumerate
+        self.result = CombinationSet(text, slots, None if exact else array("Q"))
+        # Callers waiting for the job, see JobQueue.cancel
+        self.watchers = 1
+        self._result_ref = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def run(self):
+        """Find the distinct variants in the worker pool. Called by the queue."""
+        if self._cancel.is_set():
+            return self._finish("cancelled")
+        self.state = "running"
+        self.started = time.monotonic()
+        if self.total > ENUM_MAX_VARIANTS:
+            return self._finish("failed", f"more than {ENUM_MAX_VARIANTS:,} combinations")
+        if self.result.indices is None:
+            with self._lock:
+                self.processed = self.produced = self.total
+        else:
+            self._enumerate()
+            if self.state != "running":
+                return
+            if self.produced == self.total:
+                # No combination repeated a variant, the indices are not needed
+                with self._lock:
+                    self.result.indices = None
+        variants_cache.put(self.key, self.result, self.result.nbytes)
+        self._finish("done")
+
+    def _enumerate(self):
+        # Keep the number of the first combination spelling each distinct variant
+        deadline = self.started + ENUM_TIME_LIMIT
+        indices = self.result.indices
+        seen = set()
+        size = self.result.nbytes
+        text, mode = self.key
+        tasks = [
+            (text, mode, start, min(start + JOB_CHUNK_COMBINATIONS, self.total))
+            for start in range(0, self.total, JOB_CHUNK_COMBINATIONS)
+        ]
+        chunks = imap_ordered(enumerate_range, tasks)
+        # Encoded variant and its hash table slot, plus its index
+        overhead = sys.getsizeof(b"") + 16 + indices.itemsize
+        try:
+            for task, chunk in zip(tasks, chunks):
+                # Set operations run in C, holding the GIL much less than a Python loop
+                # would, so the callbacks of other users are not slowed down
+                with self._lock, metrics.timed("dedupe"):
+                    new = chunk.keys() - seen
+                    seen.update(new)
+                    indices.extend(sorted(map(chunk.__getitem__, new)))
+                    size += sum(map(len, new)) + overhead * len(new)
+                    self.processed = task[3]
+                    self.produced = len(indices)
+                if self._cancel.is_set():
+                    return self._finish("cancelled")
+                if self.produced > ENUM_MAX_VARIANTS:
+                    return self._finish("failed", f"more than {ENUM_MAX_VARIANTS:,} combinations")
+                if size > ENUM_MAX_BYTES:
+                    return self._finish(
+                        "failed", f"the combinations need more than {ENUM_MAX_BYTES // 2 ** 20} MB"
+                    )
+                if time.monotonic() > deadline:
+                    return self._finish(
+                        "failed", f"enumerating took more than {ENUM_TIME_LIMIT:g} seconds"
+                    )
+        except Exception as e:
+            return self._finish("failed", f"enumeration error: {e}")
+        finally:
+            chunks.close()
+
+    def _finish(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.finished = time.monotonic()
+            if self.started is not None:
+                metrics.STAGE_SECONDS.observe(self.finished - self.started, stage="enumerate")
+                metrics.record_variants("job", self.produced)
+            if state == "done":
+                # Alive as long as the cache or a caller still uses it
+                self._result_ref = weakref.ref(self.result)
+            self.result = None
+        self._done.set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        """Wait for the job to end. Returns whether it ended."""
+        return self._done.wait(timeout)
+
+    def variants(self, start=0, stop=None):
+        """Variants produced so far, or all of them once the job is done."""
+        with self._lock:
+            result = self.result
+            done = self.state == "done"
+        if result is None and done:
+            result = self.final_result()
+            if result is None:
+                # Evicted from the cache meanwhile
+                stop = self.produced if stop is None else min(stop, self.produced)
+                return get_variants_page(*self.key, start, stop)
+        return [] if result is None else result[start:stop]
+
+    def final_result(self):
+        """The variants of a done job, or None once the cache and its callers dropped them."""
+        with self._lock:
+            return self._result_ref() if self._result_ref is not None else None
+
+    def status(self):
+        """Snapshot of the job progress.
+
+        Returns:
+            dict: ``state``, ``produced`` (distinct variants so far), ``processed``,
+            ``total``, ``elapsed`` and ``eta`` (seconds, None when unknown) and ``error``.
+        """
+        with self._lock:
+            now = self.finished or time.monotonic()
+            elapsed = now - self.started if self.started else 0.0
+            eta = None
+            if self.state == "running" and self.processed:
+                eta = elapsed / self.processed * (self.total - self.processed)
+            return {
+                "state": self.state,
+                "produced": self.produced,
+                "processed": self.processed,
+                "total": self.total,
+                "elapsed": elapsed,
+                "eta": eta,
+                "error": self.error,
+            }
+
+
+class JobQueue(object):
+    """In-process queue of enumeration jobs.
+
+    Args:
+        max_running (int): Jobs enumerating at the same time. Each one keeps the
+            worker pool busy, so a small number is enough.
+        max_queued (int): Jobs running or waiting, above which submissions are refused.
+        max_kept (int): Finished jobs remembered for polling.
+    """
+
+    def __init__(self, max_running=2, max_queued=ENUM_MAX_QUEUED, max_kept=256):
+        self.max_queued = max_queued
+        self.max_kept = max_kept
+        self._jobs = OrderedDict()
+        self._active = {}  # query key -> job still queued or running
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="leet-job")
+
+    def submit(self, text, mode):
+        """Queue the enumeration of a query.
+
+        A query already queued or running is not enumerated twice: its job is
+        returned, and stays alive until every caller cancelled it.
+
+        Raises:
+            TooManyCombinations: If the query has more combinations than allowed.
+            WorkersBusy: If too many jobs are already queued.
+        """
+        with self._lock:
+            job = self._active.get(normalize_query(text, mode))
+            if job is not None:
+                job.watchers += 1
+                return job
+        job = Job(text, mode)
+        if job.total > MAX_COMBINATIONS:
+            raise TooManyCombinations(
+                f"{format_count(job.total, False)} combinations, the limit is {MAX_COMBINATIONS:,}"
+            )
+        with self._lock:
+            # The same query may have been submitted meanwhile
+            active = self._active.get(job.key)
+            if active is not None:
+                active.watchers += 1
+                return active
+            if self._pending >= self.max_queued:
+                raise WorkersBusy("too many enumerations are already running")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._active[job.key] = job
+            self._forget_finished()
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        try:
+            job.run()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.max_kept)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Return a job by id, or None if it is unknown or was forgotten."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Give up a job, which stops once every caller that submitted it gave it up."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            job.watchers -= 1
+            if job.watchers > 0:
+                return
+            # Not reused by a later submission of the same query
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+        job.cancel()
+
+
+def find_all_variants(text, mode, job_id=None):
+    """Get every distinct "get all" variant of a query, without waiting for them.
+
+    Args:
+        text (str): Text to leet.
+        mode (str): Leetspeak mode, as shown in the mode dropdown.
+        job_id (str): Job given by a previous call for the same query, followed
+            instead of starting another one.
+
+    Returns:
+        Tuple[CombinationSet, Job]: The variants and None when they are cached.
+        Otherwise None and the job enumerating them.
+
+    Raises:
+        TooManyCombinations: If the query exceeds the job limits, or its job failed.
+        WorkersBusy: If the queue is full, or the job was cancelled.
+    """
+    key = normalize_query(text, mode)
+    cached = variants_cache.get(key)
+    if cached is not None:
+        return cached, None
+    job = jobs.get(job_id) if job_id else None
+    if job is None or job.key != key:
+        job = jobs.submit(text, mode)
+    state = job.status()["state"]
+    if state == "done":
+        result = job.final_result()
+        if result is not None:
+            return result, None
+        # Dropped from the cache since, enumerate it again
+        job = jobs.submit(text, mode)
+    elif state == "failed":
+        raise TooManyCombinations(job.error)
+    elif state == "cancelled":
+        raise WorkersBusy("the enumeration was cancelled")
+    return None, job
+
+
+def get_all_variants(text, mode):
+    """Get every distinct "get all" variant of a query, from the cache when possible.
+
+    Otherwise the query is enumerated by a job and the calling thread waits for
+    it, which is meant for scripts: web requests use :func:`find_all_variants`.
+
+    Args:
+        text (str): Text to leet.
+        mode (str): Leetspeak mode, as shown in the mode dropdown.
+
+    Returns:
+        CombinationSet: Distinct leetspeak variants, always in the same order.
+
+    Raises:
+        TooManyCombinations: If the enumeration exceeds the job limits.
+        WorkersBusy: If the queue is full.
+    """
+    cached = variants_cache.get(normalize_query(text, mode))
+    if cached is not None:
+        return cached
+    job = jobs.submit(text, mode)
+    # Leave time for the job to wait in the queue
+    if not job.wait(timeout=2 * ENUM_TIME_LIMIT):
+        jobs.cancel(job.id)
+        raise WorkersBusy("the enumeration could not finish in time")
+    if job.state != "done":
+        raise TooManyCombinations(job.error)
+    result = job.final_result()
+    if result is None:
+        raise WorkersBusy("the results were dropped from the cache, please try again")
+    return result
+
+
+jobs = JobQueue()
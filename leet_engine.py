@@ -0,0 +1,685 @@
+"""Lazy enumeration of leetspeak variants and prepared leetspeak engines.
+
+pyLeetSpeak's ``get_all_combs=True`` path builds the full list of variants
+before returning it. The helpers in this module work from the same
+substitution tables but describe a text as a sequence of *slots* (the spans
+that can be substituted and the characters each one can take) so that
+variants can be produced one at a time and deduplicated on the fly.
+
+The variants are the same as pyLeetSpeak's as long as no two matches overlap.
+Where they do, e.g. the "o" and "oo" targets of COVID_basic, every tiling of
+the overlapping run is enumerated (see ``MAX_CLUSTER_LENGTH``), while
+pyLeetSpeak applies one of them: COVID_basic gives 44 variants of "oo" here
+against 13 from pyLeetSpeak, which are all among the 44.
+
+A ``LeetSpeaker`` keeps its parameters as attributes and reseeds the global
+random generator when built, so it cannot be shared between requests.
+:class:`LeetEngine` holds the prepared substitution table of one mode and takes
+the random-change parameters per call, so a single instance per mode is shared
+by every request through :func:`get_engine`.
+"""
+import functools
+import math
+import random
+import re
+import sys
+import threading
+from itertools import product
+
+import unidecode
+from pyleetspeak import LeetSpeaker
+
+# Leetspeak modes offered in the app, as shown in the mode dropdown
+MODES = ("Basic", "Intermediate", "Advanced", "COVID_basic", "COVID_intermediate")
+
+# Longest run of overlapping matches whose tilings are all enumerated. The number
+# of tilings grows exponentially with the run, so longer runs only keep the
+# shortest matches (e.g. "o" instead of "oo" in "oooooo")
+MAX_CLUSTER_LENGTH = 4
+# Random draws made per distinct version asked to ``LeetEngine.random_variants``
+RANDOM_ATTEMPTS_PER_VARIANT = 4
+
+
+class Slot(object):
+    """A span of the input text and the strings it can be replaced by.
+
+    Args:
+        start (int): Index of the first character of the span.
+        end (int): Index after the last character of the span.
+        choices (Tuple[str]): Possible contents of the span. The first element is
+            always the original text, so the first variant is the unmodified input.
+    """
+
+    __slots__ = ("start", "end", "choices")
+
+    def __init__(self, start, end, choices):
+        self.start = start
+        self.end = end
+        self.choices = choices
+
+    def __repr__(self):
+        return f"Slot({self.start}, {self.end}, {self.choices!r})"
+
+
+def _unique(items):
+    return tuple(dict.fromkeys(items))
+
+
+def _cluster_choices(text, start, end, spans):
+    """Get every string a cluster of overlapping spans can turn into.
+
+    Each span is a tuple ``(span_start, span_end, subs)``. Every way of tiling
+    ``text[start:end]`` with untouched characters and substituted spans is
+    produced, original text first.
+    """
+    by_start = {}
+    for span_start, span_end, subs in spans:
+        by_start.setdefault(span_start, []).append((span_end, subs))
+
+    def tile(pos):
+        if pos == end:
+            return [""]
+        results = [text[pos] + rest for rest in tile(pos + 1)]
+        for span_end, subs in by_start.get(pos, []):
+            tails = tile(span_end)
+            results.extend(sub + rest for sub in subs for rest in tails)
+        return results
+
+    return _unique(tile(start))
+
+
+def _split_cluster(text, spans):
+    """Turn a long run of overlapping spans into independent slots.
+
+    Only the shortest spans are kept, left to right and without overlaps. Spans
+    covering the very same characters are merged.
+    """
+    shortest = min(span_end - span_start for span_start, span_end, _ in spans)
+    slots = []
+    for span_start, span_end, subs in spans:
+        if span_end - span_start != shortest:
+            continue
+        if slots and slots[-1].start == span_start:
+            slots[-1].choices = _unique(slots[-1].choices + tuple(subs))
+        elif not slots or span_start >= slots[-1].end:
+            choices = _unique([text[span_start:span_end]] + list(subs))
+            slots.append(Slot(span_start, span_end, choices))
+    return slots
+
+
+def seeded_random(seed, index=0):
+    """Random generator of the text number ``index`` of a seeded request.
+
+    Every text of a batch (or line of a file) gets its own stream, so the texts
+    of a seeded request do not all repeat the same draws. A single text, e.g.
+    the one of the page, is number 0.
+    """
+    return random.Random(f"{seed}:{index}")
+
+
+def compile_changes(list_changes):
+    """Prepare the substitution types of a mode for matching.
+
+    Args:
+        list_changes (List[Tuple]): Substitution types of a leetspeak mode, as in
+            ``LeetSpeaker.list_changes``.
+
+    Returns:
+        List[Tuple]: ``(pattern, subs)`` tuples, where ``pattern`` matches the target
+        term (overlapping and ignoring case) and ``subs`` is the list of substitutions.
+    """
+    return [
+        (
+            re.compile(rf"(?=({t1}))", re.IGNORECASE),
+            t2 if isinstance(t2, list) else [t2],
+        )
+        for t1, t2 in list_changes
+    ]
+
+
+def compile_fixed_changes(list_changes):
+    """Prepare the substitutions of a mode for fully applied uniform changes.
+
+    With ``change_prb=1``, ``change_frq=1`` and ``uniform_change=True`` every match
+    of every substitution type is replaced by the substitution drawn for the type.
+    Clashing matches are resolved like a regex alternation of the targets in type
+    order (leftmost first, then the first type), so one pass replaces them all.
+
+    Returns:
+        Tuple: ``(targets, pattern, table)``, where ``targets`` are the ``(target,
+        subs)`` types that can apply, in type order. When every target is a single
+        character, ``pattern`` is None and ``table`` is the ``str.translate`` table
+        of the types with a single substitution. Otherwise ``pattern`` matches any
+        target, in its group of the same position, and ``table`` is None. None when
+        a target is not a plain string.
+    """
+    targets = []
+    for t1, t2 in list_changes:
+        if re.escape(t1) != t1:
+            return None
+        t1 = t1.lower()
+        # An earlier single-character target always wins where this one starts
+        if any(len(t) == 1 and t == t1[0] for t, _ in targets):
+            continue
+        targets.append((t1, t2 if isinstance(t2, list) else [t2]))
+    if any(len(t) > 1 for t, _ in targets):
+        pattern = re.compile("|".join(f"({t})" for t, _ in targets), re.IGNORECASE)
+        return targets, pattern, None
+    table = {}
+    for t, subs in targets:
+        if len(subs) == 1:
+            table[ord(t)] = table[ord(t.upper())] = subs[0]
+    return targets, None, table
+
+
+def find_slots(text, substitutions):
+    """Extract the substitutable slots of an already unidecoded text.
+
+    Matches are searched the same way pyLeetSpeak does it: overlapping and
+    ignoring case. Spans that overlap each other are merged into a single slot
+    so substitutions never clash.
+
+    Args:
+        text (str): Text where the substitutions will take place.
+        substitutions (List[Tuple]): Output of :func:`compile_changes`.
+
+    Returns:
+        List[Slot]: Slots sorted by position.
+    """
+    spans = []
+    for pattern, subs in substitutions:
+        for m in pattern.finditer(text):
+            if m.end(1) > m.start(1):
+                spans.append((m.start(1), m.end(1), subs))
+    spans.sort(key=lambda span: (span[0], -span[1]))
+
+    slots = []
+    cluster = []
+    cluster_end = -1
+    for span in spans + [(len(text) + 1, len(text) + 1, [])]:
+        if cluster and span[0] >= cluster_end:
+            start = cluster[0][0]
+            if len(cluster) == 1:
+                choices = _unique([text[start:cluster_end]] + list(cluster[0][2]))
+                slots.append(Slot(start, cluster_end, choices))
+            elif cluster_end - start <= MAX_CLUSTER_LENGTH:
+                choices = _cluster_choices(text, start, cluster_end, cluster)
+                slots.append(Slot(start, cluster_end, choices))
+            else:
+                slots.extend(_split_cluster(text, cluster))
+            cluster = []
+        cluster.append(span)
+        cluster_end = max(cluster_end, span[1]) if len(cluster) > 1 else span[1]
+    return slots
+
+
+def count_combinations(slots):
+    """Count the variants described by ``slots`` without enumerating them.
+
+    Returns:
+        Tuple[int, bool]: The number of combinations and whether it is exact. It is
+        an upper bound when different combinations can spell the same variant.
+    """
+    count = 1
+    exact = True
+    for slot in slots:
+        count *= len(slot.choices)
+        if len({len(choice) for choice in slot.choices}) > 1:
+            exact = False
+    return count, exact
+
+
+def format_count(count, exact=True):
+    """Human readable number of combinations, e.g. "up to 1.20e+18"."""
+    if count < 10 ** 15:
+        count_text = f"{count:,}"
+    else:
+        # Counts can be too big for a float, so the digits are read from the integer
+        digits = str(count)
+        count_text = f"{digits[0]}.{digits[1:3]}e+{len(digits) - 1:02d}"
+    return count_text if exact else f"up to {count_text}"
+
+
+def _segments(text, slots):
+    """Split the unchanged text into the part before the first slot and the part after each slot."""
+    segments = []
+    prev_end = 0
+    for slot in slots:
+        segments.append(text[prev_end: slot.start])
+        prev_end = slot.end
+    segments.append(text[prev_end:])
+    return segments[0], segments[1:]
+
+
+def iter_variants(text, slots):
+    """Lazily yield every distinct variant described by ``slots``.
+
+    Variants are produced in a stable order, starting with the original text.
+    Only when two different combinations can spell the same string (slots whose
+    choices have different lengths) are the already emitted variants remembered.
+
+    Args:
+        text (str): Text the slots were extracted from.
+        slots (List[Slot]): Output of :func:`find_slots`.
+
+    Yields:
+        str: A leetspeak variant of the text.
+    """
+    if not slots:
+        yield text
+        return
+
+    head, tails = _segments(text, slots)
+    injective = all(len({len(c) for c in slot.choices}) == 1 for slot in slots)
+    seen = None if injective else set()
+    for comb in product(*(slot.choices for slot in slots)):
+        variant = head + "".join(chr_ + tail for chr_, tail in zip(comb, tails))
+        if seen is not None:
+            if variant in seen:
+                continue
+            seen.add(variant)
+        yield variant
+
+
+def decode_combination(index, slots):
+    """Get the choice of each slot of the combination number ``index``.
+
+    Combinations are numbered in the order :func:`iter_variants` produces them,
+    reading ``index`` as a mixed radix number whose digits are slot choices.
+    """
+    return [slot.choices[digit] for slot, digit in zip(slots, _digits(index, slots))]
+
+
+def _digits(index, slots):
+    digits = []
+    for slot in reversed(slots):
+        index, digit = divmod(index, len(slot.choices))
+        digits.append(digit)
+    digits.reverse()
+    return digits
+
+
+def iter_combination_range(text, slots, start, stop):
+    """Yield the variants of the combinations numbered ``start`` to ``stop - 1``.
+
+    Lets an enumeration be split in independent ranges, see :func:`decode_combination`.
+    Variants are not deduplicated. Ranges are cut at the last combination.
+    """
+    # Past the last combination the odometer would wrap around to the first ones
+    stop = min(stop, count_combinations(slots)[0])
+    if not slots:
+        if start <= 0 < stop:
+            yield text
+        return
+
+    head, tails = _segments(text, slots)
+    digits = _digits(start, slots)
+    radices = [len(slot.choices) for slot in slots]
+    for _ in range(start, stop):
+        yield head + "".join(
+            slot.choices[digit] + tail for slot, digit, tail in zip(slots, digits, tails)
+        )
+        # Next combination, as an odometer
+        i = len(digits) - 1
+        while i >= 0:
+            digits[i] += 1
+            if digits[i] < radices[i]:
+                break
+            digits[i] = 0
+            i -= 1
+
+
+def sample_indices(n, k, rng=random):
+    """Draw ``k`` distinct integers uniformly from ``range(n)`` in O(k).
+
+    Robert Floyd's algorithm, which unlike ``random.sample`` works for populations
+    too big for ``len``.
+    """
+    selected = set()
+    for j in range(n - k, n):
+        t = rng.randrange(j + 1)
+        selected.add(j if t in selected else t)
+    return selected
+
+
+def sample_variants(text, slots, k, rng=random):
+    """Draw ``k`` distinct variants uniformly from the combinations of ``slots``.
+
+    Only the drawn combinations are built, so time and memory are O(k) whatever
+    the number of combinations. If different combinations spell the same variant,
+    more combinations are drawn until ``k`` distinct variants are found.
+
+    Args:
+        text (str): Text the slots were extracted from.
+        slots (List[Slot]): Output of :func:`find_slots`.
+        k (int): Number of variants wanted.
+        rng (random.Random): Source of randomness, seed it for reproducible samples.
+
+    Returns:
+        List[str]: Distinct variants in combination order. All of them when there
+        are ``k`` or fewer.
+    """
+    n, _ = count_combinations(slots)
+    if k >= n:
+        return list(iter_variants(text, slots))
+
+    head, tails = _segments(text, slots)
+
+    def build(index):
+        comb = decode_combination(index, slots)
+        return head + "".join(chr_ + tail for chr_, tail in zip(comb, tails))
+
+    indices = sample_indices(n, k, rng)
+    variants = dict.fromkeys(build(index) for index in sorted(indices))
+    attempts = 0
+    while len(variants) < k and len(indices) < n and attempts < 10 * k:
+        attempts += 1
+        index = rng.randrange(n)
+        if index not in indices:
+            indices.add(index)
+            variants.setdefault(build(index))
+    return list(variants)
+
+
+class CombinationSet(object):
+    """Distinct "get all" variants of a text, stored as combinations of its slots.
+
+    Variants of a text share almost all their characters, so instead of the
+    strings only the text and its slots are kept, and variants are built when
+    they are read. When different combinations can spell the same variant, the
+    numbers of the combinations kept (see :func:`decode_combination`) are stored
+    too, which is 8 bytes per variant.
+
+    Args:
+        text (str): Text the slots were extracted from.
+        slots (List[Slot]): Output of :func:`find_slots`.
+        indices (array.array): Increasing numbers of the combinations kept, or None
+            when every combination is a distinct variant. It can keep growing
+            while the set is in use.
+    """
+
+    def __init__(self, text, slots, indices=None):
+        self.text = text
+        self.slots = slots
+        self.indices = indices
+        self.total, _ = count_combinations(slots)
+        self._head, self._tails = _segments(text, slots)
+
+    def __len__(self):
+        return self.total if self.indices is None else len(self.indices)
+
+    def _build(self, index):
+        comb = decode_combination(index, self.slots)
+        return self._head + "".join(chr_ + tail for chr_, tail in zip(comb, self._tails))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if self.indices is None and step == 1:
+                return list(iter_combination_range(self.text, self.slots, start, stop))
+            numbers = range(start, stop, step) if self.indices is None else self.indices[index]
+            return [self._build(number) for number in numbers]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("variant index out of range")
+        return self._build(index if self.indices is None else self.indices[index])
+
+    def __iter__(self):
+        variants = iter_combination_range(self.text, self.slots, 0, self.total)
+        if self.indices is None:
+            yield from variants
+            return
+        kept = iter(self.indices)
+        next_kept = next(kept, None)
+        for index, variant in enumerate(variants):
+            if next_kept is None:
+                return
+            if index == next_kept:
+                yield variant
+                next_kept = next(kept, None)
+
+    @property
+    def nbytes(self):
+        """Estimated memory used by the set."""
+        size = sys.getsizeof(self.text)
+        for slot in self.slots:
+            size += sum(sys.getsizeof(choice) for choice in slot.choices) + 64
+        if self.indices is not None:
+            size += self.indices.itemsize * len(self.indices)
+        return size
+
+    def to_compact(self):
+        """Describe the set without building its variants.
+
+        Returns:
+            dict: ``text``; ``slots``, a list of ``[start, end, choices]``; ``count``;
+            and ``index_deltas``, the differences between consecutive kept combination
+            numbers (starting from -1), or None when every combination is kept. The
+            choice of each slot in combination ``n`` is given by the digits of ``n``
+            in the mixed radix of the slots' number of choices, last slot fastest.
+        """
+        deltas = None
+        if self.indices is not None:
+            deltas = []
+            prev = -1
+            for index in self.indices:
+                deltas.append(index - prev)
+                prev = index
+        return {
+            "text": self.text,
+            "slots": [[slot.start, slot.end, list(slot.choices)] for slot in self.slots],
+            "count": len(self),
+            "index_deltas": deltas,
+        }
+
+
+class LeetEngine(object):
+    """Prepared leetspeak substitutions of one mode.
+
+    The engine is immutable once built, so a single instance can be shared by
+    several threads. Its results follow ``LeetSpeaker.text2leet`` semantics.
+
+    Args:
+        mode (str): Leetspeak mode, as accepted by ``LeetSpeaker``.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.list_changes = LeetSpeaker(mode=mode).list_changes
+        self.substitutions = compile_changes(self.list_changes)
+        self.fixed_changes = compile_fixed_changes(self.list_changes)
+
+    def find_slots(self, text):
+        """Normalize a text and find its slots.
+
+        Returns:
+            Tuple[str, List[Slot]]: The text as the substitutions see it and its slots.
+        """
+        text = unidecode.unidecode(text)
+        return text, find_slots(text, self.substitutions)
+
+    def iter_all_variants(self, text):
+        """Lazy, deduplicated equivalent of ``text2leet`` with ``get_all_combs=True``.
+
+        Returns:
+            Iterator[str]: Generator of distinct leetspeak variants.
+        """
+        text = unidecode.unidecode(text)
+        return iter_variants(text, find_slots(text, self.substitutions))
+
+    def count_combinations(self, text):
+        """Number of "get all" variants of a text, see :func:`count_combinations`."""
+        text = unidecode.unidecode(text)
+        return count_combinations(find_slots(text, self.substitutions))
+
+    def iter_combination_range(self, text, start, stop):
+        """Variants of a range of combinations, see :func:`iter_combination_range`."""
+        text = unidecode.unidecode(text)
+        return iter_combination_range(text, find_slots(text, self.substitutions), start, stop)
+
+    def sample_variants(self, text, k, rng=random):
+        """Draw ``k`` distinct "get all" variants uniformly, see :func:`sample_variants`."""
+        text = unidecode.unidecode(text)
+        return sample_variants(text, find_slots(text, self.substitutions), k, rng)
+
+    def text2leet(self, text, change_prb=0.8, change_frq=0.5, uniform_change=False, rng=random):
+        """Equivalent of ``text2leet`` with ``get_all_combs=False``.
+
+        Args:
+            text (str): Text to leet.
+            change_prb (float): Probability of applying each substitution type.
+            change_frq (float): How frequently each applied substitution type is used.
+            uniform_change (bool): Use the same substitution for every match of a target.
+            rng (random.Random): Source of randomness. Defaults to the ``random`` module.
+
+        Returns:
+            str: A random leetspeak version of the text.
+        """
+        text = unidecode.unidecode(text)
+        if self._is_fixed(change_prb, change_frq, uniform_change):
+            return self._draw_fixed(text, rng)
+        return self._draw(text, self._matches(text), change_prb, change_frq, uniform_change, rng)
+
+    def random_variants(
+        self, text, n, change_prb=0.8, change_frq=0.5, uniform_change=False, rng=random
+    ):
+        """Draw up to ``n`` distinct random leetspeak versions of a text.
+
+        The text is matched once, see :meth:`draw_variants`.
+
+        Returns:
+            List[str]: The distinct versions, in the order they were drawn.
+        """
+        return self.draw_variants(
+            self.find_matches(text), n, change_prb, change_frq, uniform_change, rng
+        )
+
+    def find_matches(self, text):
+        """Normalize a text and find the matches of every substitution type.
+
+        This is the part of a random change that does not depend on the random
+        parameters, so it can be kept while they change.
+
+        Returns:
+            Tuple[str, List[Tuple]]: The text as the substitutions see it, and the
+            substitutions and match spans of each type.
+        """
+        text = unidecode.unidecode(text)
+        return text, self._matches(text)
+
+    def draw_variants(
+        self, analysis, n, change_prb=0.8, change_frq=0.5, uniform_change=False, rng=random
+    ):
+        """Draw up to ``n`` distinct random leetspeak versions of a matched text.
+
+        Every draw only costs the random choices. Repeated versions are dropped,
+        and drawing stops after ``RANDOM_ATTEMPTS_PER_VARIANT * n`` draws, so
+        parameters allowing fewer versions (e.g. a low ``change_prb``) return
+        fewer than ``n`` of them.
+
+        Args:
+            analysis (Tuple): The text and its matches, from :meth:`find_matches`.
+            n (int): Number of versions wanted.
+            rng (random.Random): Source of randomness. The first version is the one
+                ``text2leet`` gives with the same generator.
+
+        Returns:
+            List[str]: The distinct versions, in the order they were drawn.
+        """
+        text, matches = analysis
+        if self._is_fixed(change_prb, change_frq, uniform_change):
+            draw = functools.partial(self._draw_fixed, text, rng=rng)
+        else:
+            draw = functools.partial(
+                self._draw, text, matches, change_prb, change_frq, uniform_change, rng
+            )
+        variants = {}
+        for _ in range(RANDOM_ATTEMPTS_PER_VARIANT * n):
+            variants[draw()] = None
+            if len(variants) == n:
+                break
+        return list(variants)
+
+    def _is_fixed(self, change_prb, change_frq, uniform_change):
+        # Every match is replaced, by the substitution drawn for its type
+        return (
+            change_prb >= 1 and change_frq >= 1 and uniform_change
+            and self.fixed_changes is not None
+        )
+
+    def _draw_fixed(self, text, rng):
+        targets, pattern, table = self.fixed_changes
+        # Only the types found in the text need to draw their substitution
+        lowered = text.lower()
+        if pattern is None:
+            table = dict(table)
+            for target, subs in targets:
+                if len(subs) > 1 and target in lowered:
+                    table[ord(target)] = table[ord(target.upper())] = rng.choice(subs)
+            return text.translate(table)
+        chosen = [
+            rng.choice(subs) if len(subs) > 1 and target in lowered else subs[0]
+            for target, subs in targets
+        ]
+        return pattern.sub(lambda m: chosen[m.lastindex - 1], text)
+
+    def _matches(self, text):
+        # Spans of the matches of every substitution type, which do not depend on the draw
+        return [
+            (subs, [m.span(1) for m in pattern.finditer(text)])
+            for pattern, subs in self.substitutions
+        ]
+
+    def _draw(self, text, matches, change_prb, change_frq, uniform_change, rng):
+        changes = []
+        for subs, spans in matches:
+            if rng.random() > change_prb:
+                continue
+            if uniform_change:
+                sub = rng.choice(subs)
+            chosen = [
+                (start, end, sub if uniform_change else rng.choice(subs)) for start, end in spans
+            ]
+            if chosen:
+                k = math.ceil(len(chosen) * change_frq)
+                changes.extend(rng.sample(chosen, k=k))
+
+        # Apply the changes from left to right, skipping those clashing with a previous one
+        changes.sort(key=lambda change: change[0])
+        pieces = []
+        prev_end = 0
+        for start, end, sub in changes:
+            if start < prev_end:
+                continue
+            pieces.append(text[prev_end:start])
+            pieces.append(sub)
+            prev_end = end
+        pieces.append(text[prev_end:])
+        return "".join(pieces)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(mode):
+    """Return the shared :class:`LeetEngine` of a mode, building it on first use.
+
+    Args:
+        mode (str): Leetspeak mode, case insensitive (e.g. "Basic" or "basic").
+    """
+    mode = mode.lower()
+    engine = _engines.get(mode)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(mode)
+            if engine is None:
+                engine = _engines[mode] = LeetEngine(mode)
+    return engine
+
+
+def warm_up():
+    """Build the engines of every mode so the first requests do not pay for it."""
+    for mode in MODES:
+        get_engine(mode)
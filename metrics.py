@@ -0,0 +1,226 @@
+"""Hot-path instrumentation exposed in the Prometheus text format.
+
+Stages of the leetspeak paths are timed with :func:`timed` and every HTTP
+request is measured by the hooks installed by :func:`init_app`. The metrics
+are served on ``/metrics``. Each server process keeps its own metrics, so
+with several gunicorn workers every scrape sees the worker that answered it.
+
+Setting ``LEET_LOG_REQUESTS=1`` also writes one JSON log line per request
+to stderr with its duration, size and stage timings. Stages of a streamed
+response that run after its headers were sent (e.g. ``serialize`` in the
+batch API) are only in the metrics.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+# Write a structured log line per request
+LOG_REQUESTS = os.environ.get("LEET_LOG_REQUESTS", "0") == "1"
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+request_logger = logging.getLogger("leetspeaker.requests")
+_log_handler = None
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Histogram(object):
+    """Thread-safe Prometheus histogram.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (Tuple[str]): Names of the labels given to :meth:`observe`.
+        buckets (Tuple[float]): Upper bounds of the buckets, ``+Inf`` is added.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}  # label values -> [bucket counts, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, counts):
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels(self.labelnames, key, [("le", le)])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total:g}")
+                lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return "\n".join(lines)
+
+
+class Counter(object):
+    """Thread-safe Prometheus counter, see :class:`Histogram` for the arguments."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    "leet_stage_duration_seconds",
+    "Time spent in each stage of the leetspeak paths.",
+    labelnames=("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "leet_http_request_duration_seconds",
+    "Time to answer HTTP requests, until the body starts for streamed responses.",
+    labelnames=("endpoint", "status"),
+)
+RESPONSE_BYTES = Histogram(
+    "leet_http_response_bytes",
+    "Size of the HTTP response bodies.",
+    labelnames=("endpoint",),
+    buckets=BYTES_BUCKETS,
+)
+COMBINATIONS = Histogram(
+    "leet_combinations",
+    "Number of leetspeak variants produced per request or job.",
+    labelnames=("source",),
+    buckets=COUNT_BUCKETS,
+)
+VARIANTS_TOTAL = Counter(
+    "leet_variants_total",
+    "Total number of leetspeak variants produced.",
+    labelnames=("source",),
+)
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, RESPONSE_BYTES, COMBINATIONS, VARIANTS_TOTAL]
+
+
+@contextmanager
+def timed(stage):
+    """Time a block as a stage, also recording it in the current request log."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if has_request_context():
+            spans = g.setdefault("leet_spans", {})
+            spans[stage] = spans.get(stage, 0.0) + elapsed
+
+
+def record_variants(source, count):
+    """Record the number of variants produced by a request or job."""
+    COMBINATIONS.observe(count, source=source)
+    VARIANTS_TOTAL.inc(count, source=source)
+
+
+def metered(chunks, endpoint):
+    """Pass a streamed response body through, recording its size once it is sent."""
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        RESPONSE_BYTES.observe(size, endpoint=endpoint)
+
+
+def render():
+    """All the metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def _endpoint():
+    # Dash routes all callbacks through a single URL, keep the set of labels small
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def init_app(server):
+    """Install the request hooks on the Flask server."""
+    global _log_handler
+    if LOG_REQUESTS and _log_handler is None:
+        # One bare JSON line per request on stderr, whatever the logging setup
+        _log_handler = logging.StreamHandler()
+        _log_handler.setFormatter(logging.Formatter("%(message)s"))
+        request_logger.addHandler(_log_handler)
+        request_logger.setLevel(logging.INFO)
+        request_logger.propagate = False
+
+    @server.before_request
+    def start_timer():
+        g.leet_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        start = g.get("leet_start")
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = _endpoint()
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, status=response.status_code)
+        size = None if response.is_streamed else response.calculate_content_length()
+        if size is not None:
+            RESPONSE_BYTES.observe(size, endpoint=endpoint)
+        if LOG_REQUESTS:
+            request_logger.info(
+                json.dumps(
+                    {
+                        "method": request.method,
+                        "path": request.path,
+                        "endpoint": endpoint,
+                        "status": response.status_code,
+                        "duration_ms": round(1000 * elapsed, 3),
+                        "bytes": size,
+                        "stages_ms": {
+                            stage: round(1000 * seconds, 3)
+                            for stage, seconds in g.get("leet_spans", {}).items()
+                        },
+                    }
+                )
+            )
+        return response
@@ -0,0 +1,94 @@
+"""Parameters of leetspeak batch items and the limits they are checked against.
+
+Shared by the batch API and the offline ``bulk.py``, so this module must not
+depend on the web server.
+"""
+import math
+import os
+
+from leet_engine import MODES, format_count, get_engine
+
+# Most distinct variants a "get all" enumeration job may produce
+ENUM_MAX_VARIANTS = int(os.environ.get("LEET_ENUM_MAX_VARIANTS", 1000000))
+# "Get all" queries estimated to have more combinations are refused without enumerating
+MAX_COMBINATIONS = int(os.environ.get("LEET_MAX_COMBINATIONS", ENUM_MAX_VARIANTS))
+# Maximum number of random versions drawn per text
+BATCH_MAX_RANDOM_VARIANTS = int(os.environ.get("LEET_BATCH_MAX_RANDOM_VARIANTS", 1000))
+# Maximum number of "get all" variants returned per text
+BATCH_MAX_ALL_VARIANTS = min(
+    int(os.environ.get("LEET_BATCH_MAX_ALL_VARIANTS", 10000)), ENUM_MAX_VARIANTS
+)
+# Parameters used when neither the request nor the item sets them (same as the app form)
+BATCH_DEFAULTS = {
+    "mode": "Basic",
+    "change_prb": 0.5,
+    "change_frq": 0.5,
+    "uniform_change": True,
+    "seed": None,
+    "n_variants": 1,
+    "get_all_combs": False,
+    "max_variants": 1000,
+}
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        if value.lower() in ("1", "true", "yes"):
+            return True
+        if value.lower() in ("0", "false", "no"):
+            return False
+        raise ValueError(f"invalid boolean: {value!r}")
+    return bool(value)
+
+
+def _to_number(name, value, kind):
+    # JSON numbers like 1e400 or Infinity parse as non-finite floats, which no
+    # parameter accepts (and ints cannot even hold)
+    if isinstance(value, (float, str)) and not math.isfinite(float(value)):
+        raise ValueError(f"{name} must be a finite number")
+    return kind(value)
+
+
+def validate_item(raw, defaults):
+    """Build a complete batch item from a raw item and the shared parameters.
+
+    Args:
+        raw (Union[str, dict]): A text, or a dict with a ``text`` and optional parameters.
+        defaults (dict): Parameters shared by every item of the request.
+
+    Raises:
+        ValueError: If the text or a parameter is invalid.
+    """
+    if isinstance(raw, str):
+        raw = {"text": raw}
+    if not isinstance(raw, dict) or not isinstance(raw.get("text"), str):
+        raise ValueError("each item must be a string or an object with a 'text' string")
+
+    item = dict(defaults)
+    item.update(raw)
+    modes = {mode.lower(): mode for mode in MODES}
+    if str(item["mode"]).lower() not in modes:
+        raise ValueError(f"unknown mode {item['mode']!r}, use one of {', '.join(MODES)}")
+    item["mode"] = modes[str(item["mode"]).lower()]
+    for name in ("change_prb", "change_frq"):
+        item[name] = _to_number(name, item[name], float)
+        if not 0 <= item[name] <= 1:
+            raise ValueError(f"{name} must be between 0 and 1")
+    item["uniform_change"] = _to_bool(item["uniform_change"])
+    if item["seed"] is not None:
+        item["seed"] = _to_number("seed", item["seed"], int)
+    item["n_variants"] = _to_number("n_variants", item["n_variants"], int)
+    if not 1 <= item["n_variants"] <= BATCH_MAX_RANDOM_VARIANTS:
+        raise ValueError(f"n_variants must be between 1 and {BATCH_MAX_RANDOM_VARIANTS}")
+    item["get_all_combs"] = _to_bool(item["get_all_combs"])
+    item["max_variants"] = _to_number("max_variants", item["max_variants"], int)
+    if not 1 <= item["max_variants"] <= BATCH_MAX_ALL_VARIANTS:
+        raise ValueError(f"max_variants must be between 1 and {BATCH_MAX_ALL_VARIANTS}")
+    if item["get_all_combs"]:
+        # Same limit as the "get all" option of the page
+        count, exact = get_engine(item["mode"]).count_combinations(item["text"])
+        if count > MAX_COMBINATIONS:
+            raise ValueError(
+                f"{format_count(count, exact)} combinations, the limit is {MAX_COMBINATIONS:,}"
+            )
+    return item
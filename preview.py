@@ -0,0 +1,133 @@
+"""Live preview of the random change while the user types.
+
+Every change of the text (or of the random-change parameters) sends a preview
+request numbered by the browser. The server waits ``LEET_PREVIEW_DEBOUNCE``
+seconds before computing it, and drops it as soon as a newer request of the
+same page arrives, so a burst of keystrokes costs a single preview. A result
+computed while a newer request came in is dropped as well.
+
+The preview leets each word on its own, and every page remembers the leet
+version of the words it already previewed with the same parameters, so typing
+only computes the word being typed and the rest of the preview stays still.
+Submit still leets the whole text at once (e.g. ``uniform_change`` then
+applies across words).
+"""
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+
+import metrics
+from leet_engine import get_engine
+
+# Seconds to wait for a newer keystroke before computing a preview
+PREVIEW_DEBOUNCE = float(os.environ.get("LEET_PREVIEW_DEBOUNCE", 0.03))
+# Pages whose previewed words are remembered, and words remembered per page
+PREVIEW_MAX_SESSIONS = 1024
+PREVIEW_MAX_WORDS = 4096
+
+_words_re = re.compile(r"(\s+)")
+
+
+class PreviewSession(object):
+    """Preview state of one page: its latest request and its previewed words."""
+
+    def __init__(self):
+        self.latest = 0
+        self.words = OrderedDict()  # (word, parameters) -> leet version
+        self.changed = threading.Condition()
+
+
+class Previewer(object):
+    """Debounced, incremental previews of the pages of this server process.
+
+    Args:
+        debounce (float): Seconds to wait for a newer request before computing.
+        max_sessions (int): Pages remembered, the least recently used are forgotten.
+        max_words (int): Previewed words remembered per page.
+    """
+
+    def __init__(
+        self, debounce=PREVIEW_DEBOUNCE, max_sessions=PREVIEW_MAX_SESSIONS,
+        max_words=PREVIEW_MAX_WORDS,
+    ):
+        self.debounce = debounce
+        self.max_sessions = max_sessions
+        self.max_words = max_words
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = PreviewSession()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def preview(self, session_id, seq, text, mode, change_prb, change_frq, uniform_change, seed):
+        """Leet a text for the preview of a page, unless a newer request supersedes it.
+
+        Args:
+            session_id (str): Id of the page.
+            seq (int): Number of the request, growing with every change of the page.
+            text (str): Text to leet.
+            mode (str): Leetspeak mode, as shown in the mode dropdown.
+            change_prb (float): Probability of applying each substitution type.
+            change_frq (float): How frequently each applied substitution type is used.
+            uniform_change (bool): Use the same substitution for every match of a target.
+            seed (int): Seed making the preview of each word reproducible, or None.
+
+        Returns:
+            str: The preview, or None if a newer request of the page arrived.
+        """
+        session = self._session(session_id)
+        with session.changed:
+            if seq <= session.latest:
+                return None
+            session.latest = seq
+            session.changed.notify_all()
+            # Any newer request wakes this one up, to give up at once
+            session.changed.wait_for(lambda: session.latest != seq, timeout=self.debounce)
+            if session.latest != seq:
+                return None
+
+        with metrics.timed("preview"):
+            engine = get_engine(mode)
+            params = (mode.lower(), change_prb, change_frq, bool(uniform_change), seed)
+            pieces = _words_re.split(text)
+            for i in range(0, len(pieces), 2):
+                word = pieces[i]
+                if word:
+                    pieces[i] = self._leet_word(session, engine, word, params)
+        with session.changed:
+            return "".join(pieces) if session.latest == seq else None
+
+    def supersede(self, session_id, seq):
+        """Drop the pending previews of a page older than request ``seq``."""
+        session = self._session(session_id)
+        with session.changed:
+            session.latest = max(session.latest, seq)
+            session.changed.notify_all()
+
+    def _leet_word(self, session, engine, word, params):
+        key = (word, params)
+        with session.changed:
+            res = session.words.get(key)
+            if res is not None:
+                session.words.move_to_end(key)
+                return res
+        _, change_prb, change_frq, uniform_change, seed = params
+        rng = random if seed is None else random.Random(f"{seed}:{word}")
+        res = engine.text2leet(word, change_prb, change_frq, uniform_change, rng=rng)
+        with session.changed:
+            session.words[key] = res
+            while len(session.words) > self.max_words:
+                session.words.popitem(last=False)
+        return res
+
+
+previewer = Previewer()
@@ -0,0 +1,342 @@
+"""Server-side bookkeeping of "get all" results.
+
+Results are identified by an opaque id derived from the query, so the browser
+only needs to keep the id to reach them again (e.g. from the download route).
+When ``LEET_RESULT_DIR`` is set, queries are also written there so every server
+process sharing the directory can resolve the ids of the others.
+Complete variant sets are kept in a memory-capped LRU cache so repeated queries
+(e.g. many users trying the same demo sentence) are not enumerated again.
+Seeded "random change" results are deterministic, so they are cached too, and
+so are the substitution matches of the texts, which do not depend on the
+random parameters.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import unidecode
+
+from leet_engine import get_engine, seeded_random
+
+# Limits of the "get all" variants cache. TTL is disabled when set to 0
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("LEET_CACHE_MAX_ENTRIES", 1024))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("LEET_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+RESULT_CACHE_TTL = float(os.environ.get("LEET_CACHE_TTL", 0))
+# Limits of the cache of seeded "random change" results
+RANDOM_CACHE_MAX_ENTRIES = int(os.environ.get("LEET_RANDOM_CACHE_MAX_ENTRIES", 10000))
+RANDOM_CACHE_MAX_BYTES = int(os.environ.get("LEET_RANDOM_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# Limits of the cache of the substitution matches of the "random change" texts
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("LEET_ANALYSIS_CACHE_MAX_ENTRIES", 1024))
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get("LEET_ANALYSIS_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+# Estimated memory of a cached match span
+ANALYSIS_SPAN_BYTES = 100
+# Directory shared by the server processes to resolve result ids. Memory only when unset
+RESULT_DIR = os.environ.get("LEET_RESULT_DIR") or None
+# Seconds after which queries written to the result directory are deleted
+RESULT_DIR_TTL = float(os.environ.get("LEET_RESULT_DIR_TTL", 7 * 24 * 3600))
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text, mode):
+    """Normalize a query the same way the leetspeak engine sees it."""
+    return unidecode.unidecode(text), mode.lower()
+
+
+class LRUCache(object):
+    """Thread-safe LRU cache bounded both by number of entries and by memory.
+
+    Args:
+        max_entries (int): Maximum number of entries kept.
+        max_bytes (int): Maximum total (estimated) size of the cached values.
+            A single value bigger than a quarter of it is never cached.
+        ttl (float): Seconds after which an entry expires. None or 0 disables expiration.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=256 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4
+        self.ttl = ttl or None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, size, expiration time)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value of ``key`` or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Cache ``value``, whose estimated size in bytes is ``size``.
+
+        Returns:
+            bool: Whether the value was cached.
+        """
+        if size > self.max_entry_bytes:
+            return False
+        expiration = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expiration)
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """Drop every entry, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class ResultStore(object):
+    """Bounded, thread-safe mapping from result ids to the queries that produce them.
+
+    Only the query (input text and mode) is kept: the variants themselves live in
+    the variants cache or are regenerated lazily whenever they are needed.
+
+    Args:
+        max_entries (int): Maximum number of queries kept in memory. The least
+            recently used query is evicted when the limit is exceeded.
+        directory (str): Directory where queries are also written, one small JSON
+            file per id, so other processes can resolve them. If it cannot be
+            used, the store falls back to memory only.
+        ttl (float): Seconds after which the files of the directory are deleted.
+    """
+
+    def __init__(self, max_entries=10000, directory=None, ttl=RESULT_DIR_TTL):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.ttl = ttl
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        if directory is not None:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                self._disable_directory(e)
+
+    def _disable_directory(self, error):
+        logger.warning(
+            "Cannot use %s to store results (%s), falling back to memory", self.directory, error
+        )
+        self.directory = None
+
+    def _path(self, result_id):
+        return os.path.join(self.directory, result_id + ".json")
+
+    def _write(self, result_id, query):
+        path = self._path(result_id)
+        if os.path.exists(path):
+            os.utime(path)  # Keep it from expiring
+            return
+        # Written to a temporary file first so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(query, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self._prune()
+
+    def _prune(self):
+        expiration = time.time() - self.ttl
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < expiration:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass  # Removed by another process
+
+    def _read(self, result_id):
+        try:
+            with open(self._path(result_id), encoding="utf-8") as f:
+                query = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            if self.make_id(query["Input"], query["Mode"]) == result_id:
+                return query
+        except (KeyError, TypeError, AttributeError):
+            pass
+        return None
+
+    @staticmethod
+    def make_id(text, mode):
+        key = json.dumps(normalize_query(text, mode), ensure_ascii=False).encode("utf-8")
+        return hashlib.sha1(key).hexdigest()
+
+    def register(self, text, mode):
+        """Remember a query and return its result id."""
+        result_id = self.make_id(text, mode)
+        query = {"Input": text, "Mode": mode}
+        self._remember(result_id, query)
+        if self.directory is not None:
+            try:
+                self._write(result_id, query)
+            except OSError as e:
+                self._disable_directory(e)
+        return result_id
+
+    def _remember(self, result_id, query):
+        with self._lock:
+            self._queries[result_id] = query
+            self._queries.move_to_end(result_id)
+            while len(self._queries) > self.max_entries:
+                self._queries.popitem(last=False)
+
+    def get(self, result_id):
+        """Return the query of a result id or None if it is unknown or was evicted."""
+        with self._lock:
+            query = self._queries.get(result_id)
+            if query is not None:
+                self._queries.move_to_end(result_id)
+                return query
+        # Ids are hex digests, anything else cannot be a file of the directory
+        if self.directory is None or not re.fullmatch(r"[0-9a-f]{40}", result_id or ""):
+            return None
+        query = self._read(result_id)
+        if query is not None:
+            self._remember(result_id, query)
+        return query
+
+
+def iter_variants_cached(text, mode):
+    """Iterate over the distinct "get all" variants of a query, using the cache.
+
+    Variants are generated lazily when the query is not cached, so taking only the
+    first ones is cheap even for huge combination spaces.
+
+    Args:
+        text (str): Text to leet.
+        mode (str): Leetspeak mode, as shown in the mode dropdown.
+
+    Returns:
+        Iterator[str]: Distinct leetspeak variants, always in the same order.
+    """
+    key = normalize_query(text, mode)
+    cached = variants_cache.get(key)
+    if cached is not None:
+        return iter(cached)
+    return get_engine(key[1]).iter_all_variants(key[0])
+
+
+def get_variants_page(text, mode, start, stop):
+    """Get the variants ``start`` to ``stop - 1`` of a "get all" query.
+
+    Pages of cached queries are sliced from the cache. Otherwise only the
+    combinations of the page are built, so any page costs the same whatever its
+    position. Both agree unless different combinations spell the same variant,
+    in which case uncached pages are only deduplicated within the page.
+
+    Returns:
+        List[str]: The variants of the page.
+    """
+    key = normalize_query(text, mode)
+    cached = variants_cache.get(key)
+    if cached is not None:
+        return cached[start:stop]
+    return list(dict.fromkeys(get_engine(key[1]).iter_combination_range(key[0], start, stop)))
+
+
+def random_variants_cached(text, mode, n, change_prb, change_frq, uniform_change, seed=None):
+    """Distinct random leetspeak versions of a text, reproducible and cached when seeded.
+
+    Seeded results only depend on the query, the parameters and the seed, so they
+    are the same on every server and are served from the cache when repeated.
+    Unseeded results are drawn from the ``random`` module and never cached. In both
+    cases the matches of the text are, so changing only the random parameters of
+    a text just draws again.
+
+    Args:
+        text (str): Text to leet.
+        mode (str): Leetspeak mode, as shown in the mode dropdown.
+        n (int): Number of versions wanted, see ``LeetEngine.draw_variants``.
+        change_prb (float): Probability of applying each substitution type.
+        change_frq (float): How frequently each applied substitution type is used.
+        uniform_change (bool): Use the same substitution for every match of a target.
+        seed (int): Seed of the random draws, None for different versions each time.
+
+    Returns:
+        List[str]: Up to ``n`` distinct leetspeak versions of the text.
+    """
+    key = normalize_query(text, mode)
+    if seed is not None:
+        seeded_key = key + (n, change_prb, change_frq, bool(uniform_change), seed)
+        cached = random_cache.get(seeded_key)
+        if cached is not None:
+            return cached
+    engine = get_engine(key[1])
+    # The matches only depend on the text, moving a slider just draws again
+    analysis = analysis_cache.get(key)
+    if analysis is None:
+        analysis = engine.find_matches(key[0])
+        spans = sum(len(spans) for _, spans in analysis[1])
+        analysis_cache.put(key, analysis, sys.getsizeof(key[0]) + ANALYSIS_SPAN_BYTES * spans)
+    if seed is None:
+        return engine.draw_variants(analysis, n, change_prb, change_frq, uniform_change)
+    res = engine.draw_variants(
+        analysis, n, change_prb, change_frq, uniform_change, rng=seeded_random(seed)
+    )
+    size = sys.getsizeof(key[0]) + sys.getsizeof(res) + sum(map(sys.getsizeof, res))
+    random_cache.put(seeded_key, res, size)
+    return res
+
+
+results = ResultStore(directory=RESULT_DIR)
+variants_cache = LRUCache(
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    ttl=RESULT_CACHE_TTL,
+)
+random_cache = LRUCache(
+    max_entries=RANDOM_CACHE_MAX_ENTRIES,
+    max_bytes=RANDOM_CACHE_MAX_BYTES,
+)
+analysis_cache = LRUCache(
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,168 @@
+"""Compression and caching of the responses of the Flask server.
+
+Responses above ``LEET_COMPRESS_MIN_SIZE`` bytes are compressed with the best
+of ``LEET_COMPRESS_ALGORITHM`` the client accepts (Brotli and gzip by default),
+Dash callback responses included. Flask-Compress would read streamed
+responses whole before compressing them, so the streamed routes compress
+their chunks themselves with :func:`encode_stream`.
+
+Assets whose URL carries a fingerprint (the ``m`` query parameter Dash adds to
+CSS, JS and the favicon, or the ``v`` one of :func:`asset_url`) are cached by
+browsers for a year: a new version of a file gets a new URL.
+"""
+import hashlib
+import os
+import zlib
+
+import brotli
+from flask import request
+from flask_compress import Compress
+
+# Set to 0 to disable the compression of responses, e.g. when a proxy already does it
+COMPRESS_ENABLED = os.environ.get("LEET_COMPRESS", "1") == "1"
+# Smaller responses are sent as they are
+COMPRESS_MIN_SIZE = int(os.environ.get("LEET_COMPRESS_MIN_SIZE", 500))
+# Encodings offered to clients, by order of preference
+COMPRESS_ALGORITHM = [
+    algorithm
+    for algorithm in os.environ.get("LEET_COMPRESS_ALGORITHM", "br,gzip").split(",")
+    if algorithm in ("br", "gzip")
+]
+# Compressed types, besides Flask-Compress defaults (HTML, CSS, JS, JSON and XML)
+COMPRESS_EXTRA_MIMETYPES = [
+    "text/plain",
+    "application/x-ndjson",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+    "image/svg+xml",
+]
+# Browser cache lifetime of fingerprinted assets, in seconds
+ASSETS_MAX_AGE = 365 * 24 * 3600
+
+_asset_fingerprints = {}
+_compress = None
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def brotli_chunks(chunks):
+    """Compress a stream of byte chunks with Brotli."""
+    compressor = brotli.Compressor(quality=4)
+    for chunk in chunks:
+        compressed = compressor.process(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.finish()
+
+
+def choose_encoding(accept_encoding, algorithms=None):
+    """Best of ``algorithms`` for an ``Accept-Encoding`` header, or None for identity.
+
+    The encoding with the highest quality value (``q``) wins, ties go to the
+    first of ``algorithms``. ``*`` stands for the encodings the header does not
+    name, and the response stays uncompressed when the client prefers identity.
+
+    Args:
+        accept_encoding (str): The header, e.g. ``"gzip, deflate, br;q=0.9"``.
+        algorithms (List[str]): Encodings offered. Defaults to ``COMPRESS_ALGORITHM``.
+    """
+    if algorithms is None:
+        algorithms = COMPRESS_ALGORITHM
+    qualities = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if not 0 <= quality <= 1:
+            quality = 0.0
+        qualities[coding] = quality
+
+    best, best_quality = None, 0.0
+    for algorithm in algorithms:
+        quality = qualities.get(algorithm, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = algorithm, quality
+    if best is not None and qualities.get("identity", 0.0) > best_quality:
+        return None
+    return best
+
+
+def negotiate_encoding():
+    """Content encoding of the current request, or None to send it uncompressed."""
+    if _compress is None:
+        return None
+    return choose_encoding(request.headers.get("Accept-Encoding", ""))
+
+
+def encode_stream(chunks, encoding):
+    """Compress a stream of byte chunks with the encoding given by :func:`negotiate_encoding`."""
+    if encoding == "br":
+        return brotli_chunks(chunks)
+    if encoding == "gzip":
+        return gzip_chunks(chunks)
+    return chunks
+
+
+def asset_url(app, path):
+    """URL of an asset with a fingerprint of its content, so it can be cached for long."""
+    fingerprint = _asset_fingerprints.get(path)
+    if fingerprint is None:
+        with open(os.path.join(app.config.assets_folder, path), "rb") as f:
+            fingerprint = hashlib.sha1(f.read()).hexdigest()[:12]
+        _asset_fingerprints[path] = fingerprint
+    return f"{app.get_asset_url(path)}?v={fingerprint}"
+
+
+def init_app(app):
+    """Set up compression and asset caching on the server of a Dash app.
+
+    Install it after any hook that should see the compressed responses (e.g.
+    the metrics ones): Flask runs the last installed hooks first.
+    """
+    server = app.server
+    assets_prefix = app.get_asset_url("")
+
+    @server.after_request
+    def cache_fingerprinted_assets(response):
+        if (
+            request.path.startswith(assets_prefix)
+            and ("m" in request.args or "v" in request.args)
+            and response.status_code == 200
+        ):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = ASSETS_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    if COMPRESS_ENABLED and COMPRESS_ALGORITHM:
+        server.config["COMPRESS_ALGORITHM"] = COMPRESS_ALGORITHM
+        server.config["COMPRESS_MIN_SIZE"] = COMPRESS_MIN_SIZE
+        # Streamed responses are compressed by their routes, see encode_stream
+        server.config["COMPRESS_STREAMS"] = False
+        server.config["COMPRESS_MIMETYPES"] = [
+            "text/html",
+            "text/css",
+            "text/xml",
+            "application/json",
+            "application/javascript",
+        ] + COMPRESS_EXTRA_MIMETYPES
+        global _compress
+        _compress = Compress(server)
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# The app modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def pool():
+    yield
+    # Stop the pool processes started by the tests, if any
+    if "workers" in sys.modules:
+        sys.modules["workers"].shutdown_pool()
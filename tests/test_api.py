@@ -0,0 +1,94 @@
+"""Tests of the batch and download routes."""
+import json
+import time
+
+import pytest
+
+import app
+import jobs
+from leet_engine import get_engine
+from result_store import variants_cache
+
+
+@pytest.fixture
+def client():
+    return app.server.test_client()
+
+
+def batch(client, body, **kwargs):
+    response = client.post("/api/batch", data=body, content_type="application/json", **kwargs)
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return response.status_code, records
+
+
+def test_batch_streams_one_record_per_item(client):
+    body = json.dumps({"items": ["hello", {"text": "world", "mode": "advanced"}], "seed": 3})
+    status, records = batch(client, body)
+    assert status == 200
+    assert [record["index"] for record in records] == [0, 1]
+    assert [record["text"] for record in records] == ["hello", "world"]
+    # Seeded batches are reproducible
+    assert batch(client, body)[1] == records
+
+
+def test_batch_get_all(client):
+    body = json.dumps({"items": ["virus"], "get_all_combs": True, "max_variants": 2})
+    status, records = batch(client, body)
+    assert status == 200
+    assert len(records[0]["output"]) == 2
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        '{"items": ["hi"], "seed": 1e400}',
+        '{"items": ["hi"], "seed": Infinity}',
+        '{"items": [{"text": "hi", "n_variants": -Infinity}]}',
+        '{"items": ["hi"], "max_variants": NaN}',
+        '{"items": ["hi"], "change_prb": NaN}',
+        '{"items": ["hi"], "change_frq": "inf"}',
+        '{"items": ["hi"], "mode": "klingon"}',
+        '{"items": ["hi"], "n_variants": 0}',
+        '{"items": [3]}',
+        '{"texts": ["hi"]}',
+        '{"items": ["covid vaccine virus"], "get_all_combs": true, "mode": "Advanced"}',
+    ],
+)
+def test_invalid_batch_is_refused(client, body):
+    response = client.post("/api/batch", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def download(client, url):
+    statuses = []
+    while True:
+        response = client.get(url)
+        statuses.append(response.status_code)
+        if response.status_code != 202:
+            return response, statuses
+        assert response.headers["Retry-After"]
+        assert response.get_json()["state"] in ("queued", "running")
+        url = response.headers["Location"]
+        time.sleep(0.01)
+
+
+def test_download_does_not_wait_for_the_enumeration(client):
+    variants_cache.clear()
+    result_id = app.results.register("oo", "COVID_basic")
+    response, statuses = download(client, f"/download/{result_id}?format=txt")
+    assert statuses[0] == 202
+    assert statuses[-1] == 200
+    expected = list(get_engine("COVID_basic").iter_all_variants("oo"))
+    assert response.get_data(as_text=True).splitlines() == expected
+    # Served from the cache from now on
+    assert client.get(f"/download/{result_id}?format=txt").status_code == 200
+
+
+def test_download_of_a_failed_enumeration(client, monkeypatch):
+    variants_cache.clear()
+    monkeypatch.setattr(jobs, "ENUM_MAX_VARIANTS", 10)
+    result_id = app.results.register("oo", "COVID_basic")
+    response, statuses = download(client, f"/download/{result_id}?format=txt")
+    assert statuses[0] == 202
+    assert response.status_code == 413
@@ -0,0 +1,15 @@
+"""Tests of the Dash callbacks."""
+import app
+
+
+def test_results_table_of_a_huge_result():
+    table = app.render_results_table(["h3ll0"], 10 ** 400)
+    assert table.page_count == app.MAX_RESULT_PAGES
+    assert app.render_results_table([], 0).page_count == 1
+    assert app.render_results_table(["a"] * 3, app.RESULTS_PAGE_SIZE + 1).page_count == 2
+
+
+def test_results_page_past_the_last_one():
+    result_id = app.results.register("virus", "Basic")
+    page = app.change_results_page.__wrapped__(1000, result_id)
+    assert page == []
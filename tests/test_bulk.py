@@ -0,0 +1,73 @@
+"""Tests of the offline bulk command."""
+import json
+
+import pytest
+
+import bulk
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text("".join(f"hello world {i}\n" for i in range(50)), encoding="utf-8")
+    return path
+
+
+def run(corpus, output, *options):
+    bulk.main([str(corpus), str(output), "--seed", "7", "--shard-lines", "8", *options])
+
+
+def test_bulk_writes_one_output_per_line(corpus, tmp_path):
+    output = tmp_path / "out.ndjson"
+    run(corpus, output, "--format", "ndjson")
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [record["index"] for record in records] == list(range(50))
+    assert records[3]["text"] == "hello world 3"
+    assert not (tmp_path / "out.ndjson.checkpoint").exists()
+
+
+def test_bulk_resumes_after_an_interruption(corpus, tmp_path, monkeypatch):
+    expected = tmp_path / "expected.txt"
+    run(corpus, expected)
+
+    output = tmp_path / "out.txt"
+    save_checkpoint = bulk.save_checkpoint
+    saved = []
+
+    def interrupted(path, checkpoint):
+        save_checkpoint(path, checkpoint)
+        saved.append(checkpoint["lines"])
+        if len(saved) == 3:
+            # Lines written after the last checkpoint are dropped on resume
+            with open(output, "ab") as f:
+                f.write(b"partial shard")
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(bulk, "save_checkpoint", interrupted)
+    with pytest.raises(SystemExit):
+        run(corpus, output)
+    assert saved == [8, 16, 24]
+    monkeypatch.setattr(bulk, "save_checkpoint", save_checkpoint)
+
+    run(corpus, output)
+    assert output.read_bytes() == expected.read_bytes()
+    assert not (tmp_path / "out.txt.checkpoint").exists()
+
+
+def test_bulk_refuses_a_checkpoint_of_other_parameters(corpus, tmp_path):
+    output = tmp_path / "out.txt"
+    checkpoint = tmp_path / "out.txt.checkpoint"
+    checkpoint.write_text(json.dumps({"input": "other.txt", "lines": 8}), encoding="utf-8")
+    with pytest.raises(SystemExit) as e:
+        run(corpus, output)
+    assert "belongs to another input" in str(e.value)
+    run(corpus, output, "--restart")
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 50
+
+
+def test_bulk_empty_input(tmp_path):
+    corpus = tmp_path / "empty.txt"
+    corpus.write_bytes(b"")
+    output = tmp_path / "out.txt"
+    run(corpus, output)
+    assert output.read_bytes() == b""
@@ -0,0 +1,96 @@
+"""Tests of the background "get all" jobs."""
+import threading
+
+import pytest
+
+from jobs import JobQueue, TooManyCombinations, WorkersBusy
+from leet_engine import get_engine
+from result_store import variants_cache
+
+# Combinations of different lengths, so the job deduplicates them in the pool
+TEXT, MODE = "oo", "COVID_basic"
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_running=1, max_queued=3, max_kept=2)
+    yield queue
+    queue._executor.shutdown(wait=True)
+
+
+@pytest.fixture
+def blocked(queue):
+    # Keep the only running slot busy, so submitted jobs stay queued
+    release = threading.Event()
+    queue._executor.submit(release.wait)
+    yield queue
+    release.set()
+
+
+def test_identical_queries_share_a_job(blocked):
+    first = blocked.submit(TEXT, MODE)
+    assert blocked.submit(TEXT, MODE.lower()) is first
+    assert first.watchers == 2
+    assert blocked.submit("hello", MODE) is not first
+
+
+def test_job_stops_when_every_caller_cancelled(blocked):
+    job = blocked.submit(TEXT, MODE)
+    blocked.submit(TEXT, MODE)
+    blocked.cancel(job.id)
+    assert not job._cancel.is_set()
+    blocked.cancel(job.id)
+    assert job._cancel.is_set()
+    # A cancelled job is not handed to new callers
+    assert blocked.submit(TEXT, MODE) is not job
+
+
+def test_full_queue_is_refused(blocked):
+    for text in ("hi", "go", "sat"):
+        blocked.submit(text, MODE)
+    with pytest.raises(WorkersBusy):
+        blocked.submit("test", MODE)
+
+
+def test_too_many_combinations_are_refused(queue):
+    with pytest.raises(TooManyCombinations):
+        queue.submit("covid vaccine " * 10, "Advanced")
+
+
+def test_done_job_hands_its_result_to_the_cache(queue):
+    variants_cache.clear()
+    job = queue.submit(TEXT, MODE)
+    assert job.wait(30)
+    expected = list(get_engine(MODE).iter_all_variants(TEXT))
+    assert job.state == "done"
+    assert job.result is None
+    assert list(job.final_result()) == expected
+    assert job.variants(0, 10) == expected[:10]
+    # Once the cache drops it, pages are built again from the combinations
+    variants_cache.clear()
+    assert job.final_result() is None
+    assert job.variants(0, 10) == expected[:10]
+
+
+def test_finished_jobs_are_forgotten(queue):
+    finished = []
+    for text in ("hi", "go", "sat"):
+        job = queue.submit(text, MODE)
+        assert job.wait(30)
+        finished.append(job)
+    queue.submit("test", MODE).wait(30)
+    assert queue.get(finished[0].id) is None
+    assert queue.get(finished[-1].id) is finished[-1]
+
+
+def test_poll_of_a_failed_job_with_an_unknown_result(monkeypatch):
+    import app
+
+    class FailedJob(object):
+        def status(self):
+            return {"state": "failed", "error": "too slow"}
+
+    monkeypatch.setattr(app.jobs, "get", lambda job_id: FailedJob())
+    display, disabled, _ = app.poll_job.__wrapped__(1, "job", "unknown-result")
+    assert disabled
+    assert "no longer available" in display.children
@@ -0,0 +1,145 @@
+"""Tests of the leetspeak engine against pyLeetSpeak."""
+import random
+
+import pytest
+from pyleetspeak import LeetSpeaker
+
+from leet_engine import MODES, format_count, get_engine, iter_combination_range
+
+# Words without overlapping matches in any mode, small enough for pyLeetSpeak
+WORDS = ("hi", "go", "sat", "test", "virus", "covid")
+# Text mixing case, digits and overlapping matches
+MIXED_TEXT = "Oo Covid VACCINE 2021, hello WORLD"
+
+
+class FixedChoice(object):
+    """Random generator applying every change and always choosing the same substitution."""
+
+    def __init__(self, pick):
+        self.pick = pick
+
+    def random(self):
+        return 0.0
+
+    def choice(self, seq):
+        return seq[self.pick % len(seq)]
+
+    def sample(self, population, k):
+        return list(population)[:k]
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("text", WORDS)
+def test_iter_all_variants_matches_pyleetspeak(mode, text):
+    expected = LeetSpeaker(mode=mode.lower(), get_all_combs=True).text2leet(text)
+    variants = list(get_engine(mode).iter_all_variants(text))
+    assert len(variants) == len(set(variants))
+    assert set(variants) == set(expected)
+    assert variants[0] == text
+
+
+def test_overlapping_matches_give_more_variants():
+    # "o" and "oo" are both targets, every tiling of "oo" is enumerated
+    expected = LeetSpeaker(mode="covid_basic", get_all_combs=True).text2leet("oo")
+    variants = list(get_engine("COVID_basic").iter_all_variants("oo"))
+    assert len(expected) == 13
+    assert len(variants) == 44
+    assert set(expected) <= set(variants)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_engines_are_shared(mode):
+    assert get_engine(mode) is get_engine(mode.lower())
+    assert get_engine(mode).text2leet("") == ""
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("text", WORDS + ("oo", "covid test"))
+def test_count_combinations(mode, text):
+    engine = get_engine(mode)
+    count, exact = engine.count_combinations(text)
+    variants = list(engine.iter_all_variants(text))
+    if exact:
+        assert count == len(variants)
+    else:
+        assert count >= len(variants)
+    # Every combination is produced once, repeated variants included
+    assert len(list(engine.iter_combination_range(text, 0, count))) == count
+
+
+def test_count_combinations_of_long_text_is_exact():
+    engine = get_engine("Advanced")
+    text = "hello world " * 60
+    count, _ = engine.count_combinations(text)
+    _, slots = engine.find_slots(text)
+    expected = 1
+    for slot in slots:
+        expected *= len(slot.choices)
+    assert count == expected
+    assert len(str(count)) > 308
+
+
+@pytest.mark.parametrize(
+    "count, exact, expected",
+    [
+        (0, True, "0"),
+        (1234, True, "1,234"),
+        (1234, False, "up to 1,234"),
+        (10 ** 15 - 1, True, "999,999,999,999,999"),
+        (1234 * 10 ** 20, True, "1.23e+23"),
+        (10 ** 400, False, "up to 1.00e+400"),
+    ],
+)
+def test_format_count(count, exact, expected):
+    assert format_count(count, exact) == expected
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("k", [1, 10, 100])
+def test_sample_variants_are_distinct(mode, k):
+    engine = get_engine(mode)
+    sample = engine.sample_variants(MIXED_TEXT, k, random.Random(k))
+    assert len(sample) == k
+    assert len(set(sample)) == k
+    # Same seed, same sample
+    assert engine.sample_variants(MIXED_TEXT, k, random.Random(k)) == sample
+
+
+def test_sample_variants_of_small_text_returns_all():
+    engine = get_engine("Basic")
+    assert engine.sample_variants("virus", 100) == list(engine.iter_all_variants("virus"))
+    sample = engine.sample_variants("virus", 3, random.Random(0))
+    assert set(sample) <= set(engine.iter_all_variants("virus"))
+
+
+def test_combination_range_is_cut_at_the_last_combination():
+    engine = get_engine("Basic")
+    text, slots = engine.find_slots("virus")
+    variants = list(engine.iter_all_variants(text))
+    assert list(iter_combination_range(text, slots, 2, 10)) == variants[2:]
+    assert list(iter_combination_range(text, slots, 10, 20)) == []
+    assert list(iter_combination_range("xyz", [], 0, 5)) == ["xyz"]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_fixed_changes_match_general_path(mode):
+    engine = get_engine(mode)
+    if engine.fixed_changes is None:
+        pytest.skip("no fast path for this mode")
+    assert engine._is_fixed(1, 1, True)
+    for text in WORDS + ("oo", MIXED_TEXT):
+        text, matches = engine.find_matches(text)
+        for pick in range(4):
+            fast = engine._draw_fixed(text, FixedChoice(pick))
+            general = engine._draw(text, matches, 1, 1, True, FixedChoice(pick))
+            assert fast == general, (text, pick)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_fixed_changes_are_reproducible(mode):
+    engine = get_engine(mode)
+    first = engine.text2leet(MIXED_TEXT, 1, 1, True, rng=random.Random(7))
+    assert engine.text2leet(MIXED_TEXT, 1, 1, True, rng=random.Random(7)) == first
+    variants = engine.random_variants(MIXED_TEXT, 5, 1, 1, True, rng=random.Random(7))
+    assert variants[0] == first
+    assert len(variants) == len(set(variants))
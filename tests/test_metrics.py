@@ -0,0 +1,60 @@
+"""Tests of the request metrics and logs."""
+import io
+import json
+
+import pytest
+from flask import Flask
+
+import metrics
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(metrics, "LOG_REQUESTS", True)
+    monkeypatch.setattr(metrics, "_log_handler", None)
+    server = Flask(__name__)
+    metrics.init_app(server)
+
+    @server.route("/leet/<text>")
+    def leet(text):
+        with metrics.timed("engine"):
+            return text.replace("e", "3")
+
+    @server.route("/metrics")
+    def metrics_endpoint():
+        return metrics.render()
+
+    yield server
+    metrics.request_logger.removeHandler(metrics._log_handler)
+    metrics.request_logger.propagate = True
+
+
+def test_logs_one_line_per_request(server):
+    stream = io.StringIO()
+    metrics._log_handler.setStream(stream)
+    client = server.test_client()
+    assert client.get("/leet/hello").get_data() == b"h3llo"
+    client.get("/leet/eee")
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record["path"] == "/leet/hello"
+    assert record["endpoint"] == "/leet/<text>"
+    assert record["status"] == 200
+    assert record["bytes"] == 5
+    assert set(record["stages_ms"]) == {"engine"}
+
+
+def test_init_app_twice_keeps_one_handler(server):
+    handler = metrics._log_handler
+    metrics.init_app(Flask(__name__))
+    assert metrics._log_handler is handler
+    assert metrics.request_logger.handlers.count(handler) == 1
+
+
+def test_metrics_endpoint(server):
+    client = server.test_client()
+    client.get("/leet/test")
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'leet_stage_duration_seconds_count{stage="engine"}' in body
+    assert 'leet_http_request_duration_seconds_count{endpoint="/leet/<text>",status="200"}' in body
@@ -0,0 +1,80 @@
+"""Tests of the live preview."""
+import threading
+
+from leet_engine import get_engine
+from preview import Previewer
+
+PARAMS = ("Advanced", 1, 1, True, 5)
+
+
+def test_preview_is_reproducible_and_incremental():
+    previewer = Previewer(debounce=0)
+    first = previewer.preview("page", 1, "hello world", *PARAMS)
+    assert first is not None
+    typed = previewer.preview("page", 2, "hello world again", *PARAMS)
+    # Words already previewed keep their leet version while typing
+    assert typed.startswith(first + " ")
+    assert Previewer(debounce=0).preview("other", 1, "hello world", *PARAMS) == first
+
+
+def test_preview_keeps_the_spaces():
+    previewer = Previewer(debounce=0)
+    assert previewer.preview("page", 1, "  a \n b  ", "Basic", 0, 0, False, None) == "  a \n b  "
+
+
+def test_older_requests_are_dropped():
+    previewer = Previewer(debounce=0)
+    assert previewer.preview("page", 2, "hello", *PARAMS) is not None
+    assert previewer.preview("page", 1, "hell", *PARAMS) is None
+    assert previewer.preview("page", 2, "hello", *PARAMS) is None
+
+
+def test_newer_request_supersedes_a_waiting_one():
+    previewer = Previewer(debounce=5)
+    results = []
+    waiting = threading.Thread(
+        target=lambda: results.append(previewer.preview("page", 1, "hel", *PARAMS))
+    )
+    waiting.start()
+    while previewer._session("page").latest != 1:
+        pass
+    previewer.supersede("page", 2)
+    waiting.join(timeout=2)
+    assert not waiting.is_alive()
+    assert results == [None]
+
+
+def test_burst_costs_a_single_preview(monkeypatch):
+    previewer = Previewer(debounce=0.2)
+    engine = get_engine("Advanced")
+    calls = []
+    text2leet = engine.text2leet
+
+    def counted(word, *args, **kwargs):
+        calls.append(word)
+        return text2leet(word, *args, **kwargs)
+
+    def preview(seq, text):
+        results[seq] = previewer.preview("page", seq, text, *PARAMS)
+
+    monkeypatch.setattr(engine, "text2leet", counted)
+    results = {}
+    threads = []
+    for seq, text in enumerate(["h", "he", "hel", "hell", "hello"], 1):
+        thread = threading.Thread(target=preview, args=(seq, text))
+        thread.start()
+        threads.append(thread)
+        while previewer._session("page").latest != seq:
+            pass
+    for thread in threads:
+        thread.join()
+    assert [seq for seq, result in sorted(results.items()) if result is not None] == [5]
+    assert calls == ["hello"]
+
+
+def test_sessions_are_bounded():
+    previewer = Previewer(debounce=0, max_sessions=2, max_words=3)
+    for page in ("a", "b", "c"):
+        previewer.preview(page, 1, "one two three four", *PARAMS)
+    assert list(previewer._sessions) == ["b", "c"]
+    assert len(previewer._sessions["c"].words) == 3
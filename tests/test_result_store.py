@@ -0,0 +1,67 @@
+"""Tests of the result ids and the caches of "get all" results."""
+import time
+
+from result_store import LRUCache, ResultStore
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(max_entries=2, max_bytes=1000)
+    cache.put("a", 1, 10)
+    cache.put("b", 2, 10)
+    assert cache.get("a") == 1
+    cache.put("c", 3, 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"entries": 2, "bytes": 20, "hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_lru_cache_is_bounded_by_bytes():
+    cache = LRUCache(max_entries=100, max_bytes=1000)
+    # Bigger than a quarter of the cache, never kept
+    assert not cache.put("big", "x", 251)
+    assert cache.get("big") is None
+    for i in range(5):
+        assert cache.put(i, i, 250)
+    assert cache.stats()["bytes"] == 1000
+    assert cache.get(0) is None
+    # Replacing an entry does not count it twice
+    cache.put(4, 4, 100)
+    assert cache.stats()["bytes"] == 850
+
+
+def test_lru_cache_entries_expire():
+    cache = LRUCache(ttl=0.05)
+    cache.put("a", 1, 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_result_ids_follow_the_query():
+    store = ResultStore()
+    result_id = store.register("hello", "Basic")
+    assert result_id == store.register("hello", "basic")
+    assert result_id != store.register("hello", "Advanced")
+    assert store.get(result_id) == {"Input": "hello", "Mode": "basic"}
+    assert store.get("unknown") is None
+
+
+def test_result_store_is_bounded():
+    store = ResultStore(max_entries=2)
+    first = store.register("a", "Basic")
+    store.register("b", "Basic")
+    store.register("c", "Basic")
+    assert store.get(first) is None
+
+
+def test_result_directory_is_shared(tmp_path):
+    writer = ResultStore(directory=str(tmp_path))
+    reader = ResultStore(directory=str(tmp_path))
+    result_id = writer.register("hello world", "Advanced")
+    assert reader.get(result_id) == {"Input": "hello world", "Mode": "Advanced"}
+    # Files that do not match their id are ignored
+    other_id = writer.register("other", "Basic")
+    (tmp_path / f"{other_id}.json").write_text('{"Input": "forged", "Mode": "Basic"}')
+    assert ResultStore(directory=str(tmp_path)).get(other_id) is None
+    assert reader.get("../" + result_id) is None
@@ -0,0 +1,43 @@
+"""Tests of the response compression helpers."""
+import gzip
+
+import brotli
+import pytest
+
+from serving import choose_encoding, encode_stream
+
+ALGORITHMS = ["br", "gzip"]
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("", None),
+        ("gzip", "gzip"),
+        ("gzip, deflate, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("BR ; q=1.0 , gzip;q=0.9", "br"),
+        ("gzip;q=0, br;q=0", None),
+        ("*", "br"),
+        ("*;q=0.1, gzip", "gzip"),
+        ("identity", None),
+        ("identity;q=1, gzip;q=0.5", None),
+        ("gzip;q=0.8, identity;q=0.5", "gzip"),
+        ("deflate", None),
+        ("gzip;q=abc, br;q=2", None),
+    ],
+)
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header, ALGORITHMS) == expected
+
+
+def test_choose_encoding_follows_the_offered_order():
+    assert choose_encoding("gzip, br", ["gzip", "br"]) == "gzip"
+    assert choose_encoding("br", ["gzip"]) is None
+
+
+@pytest.mark.parametrize("encoding, decompress", [("gzip", gzip.decompress), ("br", brotli.decompress)])
+def test_encode_stream(encoding, decompress):
+    chunks = [b"h3ll0 w0rld\n" * 100, b"", b"l33t\n"]
+    assert decompress(b"".join(encode_stream(iter(chunks), encoding))) == b"".join(chunks)
+    assert list(encode_stream(iter(chunks), None)) == chunks
@@ -0,0 +1,34 @@
+"""Tests of the work done in the process pool."""
+from leet_engine import get_engine, seeded_random
+from params import BATCH_DEFAULTS, validate_item
+from workers import imap_ordered, leet_chunk, leet_item
+
+
+def items(texts, **params):
+    return [validate_item(text, dict(BATCH_DEFAULTS, **params)) for text in texts]
+
+
+def test_imap_ordered_keeps_the_input_order():
+    texts = [f"text {i}" for i in range(40)]
+    tasks = ((start, items(texts[start: start + 3], change_prb=0)) for start in range(0, 40, 3))
+    outputs = [output for chunk in imap_ordered(leet_chunk, tasks, max_in_flight=2) for output in chunk]
+    # Nothing changes with change_prb=0, so the outputs are the texts
+    assert outputs == texts
+
+
+def test_leet_item_get_all():
+    (item,) = items(["virus"], get_all_combs=True, max_variants=3)
+    assert leet_item(item) == list(get_engine("Basic").iter_all_variants("virus"))[:3]
+
+
+def test_seeded_items_draw_from_their_position():
+    # Identical texts of a seeded batch still get their own stream
+    chunk = items(["hello world"] * 20, mode="Advanced", seed=42)
+    outputs = leet_chunk((0, chunk))
+    assert len(set(outputs)) > 1
+    assert leet_chunk((0, chunk)) == outputs
+    # A chunk starting further in the batch continues the same streams
+    assert leet_chunk((5, chunk[5:])) == outputs[5:]
+    # The first item gives what the page gives with the same seed
+    engine = get_engine("Advanced")
+    assert outputs[0] == engine.text2leet("hello world", 0.5, 0.5, True, rng=seeded_random(42))
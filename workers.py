@@ -0,0 +1,185 @@
+"""Process pool used to spread CPU-bound leetspeak work across cores.
+
+The pool uses the "spawn" start method: the web server runs threaded workers,
+and forking a threaded process is unsafe. Each pool process builds its own
+leetspeak engines the first time it needs them.
+
+Building and serializing variants holds the GIL, so it is done here rather
+than in the web server threads, where it would delay every other callback.
+"""
+import json
+import os
+import random
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from leet_engine import CombinationSet, get_engine, seeded_random
+
+# Number of processes of the pool. Defaults to the number of cores
+WORKER_PROCESSES = int(os.environ.get("LEET_WORKER_PROCESSES", 0)) or os.cpu_count() or 1
+# Number of variants serialized by a pool process at once
+SERIALIZE_CHUNK_VARIANTS = 10000
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process pool of the current process, starting it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=WORKER_PROCESSES, mp_context=get_context("spawn")
+                )
+    return _pool
+
+
+def shutdown_pool(wait=True):
+    """Stop the process pool of the current process, if it was started."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def imap_ordered(func, chunks, max_in_flight=None):
+    """Apply ``func`` to each chunk in the pool and yield the results in order.
+
+    Unlike ``Executor.map``, chunks are submitted as results are consumed, so only
+    ``max_in_flight`` chunks (twice the pool size by default) are pending at a time.
+    """
+    pool = get_pool()
+    max_in_flight = max_in_flight or 2 * WORKER_PROCESSES
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(func, chunk))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def leet_item(item, index=0):
+    """Leet a single validated batch item.
+
+    Args:
+        item (dict): ``text`` and ``mode`` plus either ``change_prb``, ``change_frq``,
+            ``uniform_change``, ``seed`` and ``n_variants`` or ``get_all_combs`` and
+            ``max_variants``.
+        index (int): Position of the item in its request, which seeded items draw
+            from (see ``leet_engine.seeded_random``).
+
+    Returns:
+        Union[str, List[str]]: The random leetspeak version of the text, or a list of
+        ``n_variants`` distinct ones when more than one is asked, or its first
+        ``max_variants`` distinct variants in "get all" mode. A seeded item in first
+        position gives the same versions as the web page with the same parameters
+        and seed.
+    """
+    engine = get_engine(item["mode"])
+    if item["get_all_combs"]:
+        variants = engine.iter_all_variants(item["text"])
+        return [variant for _, variant in zip(range(item["max_variants"]), variants)]
+    variants = engine.random_variants(
+        item["text"],
+        item["n_variants"],
+        change_prb=item["change_prb"],
+        change_frq=item["change_frq"],
+        uniform_change=item["uniform_change"],
+        rng=random if item["seed"] is None else seeded_random(item["seed"], index),
+    )
+    return variants if item["n_variants"] > 1 else variants[0]
+
+
+def leet_chunk(task):
+    """Leet a chunk of batch items. Runs inside a pool process.
+
+    Args:
+        task (Tuple): ``(start, items)``, the items and the position of the first one.
+    """
+    start, items = task
+    return [leet_item(item, index) for index, item in enumerate(items, start)]
+
+
+def leet_texts(task):
+    """Leet texts sharing the same parameters. Runs inside a pool process.
+
+    Args:
+        task (Tuple): ``(params, start, texts)``, a validated batch item without its
+            text, the position of the first text and the texts to leet with it.
+    """
+    params, start, texts = task
+    return [leet_item(dict(params, text=text), index) for index, text in enumerate(texts, start)]
+
+
+def enumerate_range(task):
+    """Distinct variants of a range of "get all" combinations. Runs inside a pool process.
+
+    Args:
+        task (Tuple): ``(text, mode, start, stop)``, see ``LeetEngine.iter_combination_range``.
+
+    Returns:
+        dict: The number of the first combination spelling each variant, by encoded
+        variant. Variants repeated across ranges are left to the job, which can then
+        merge ranges with set operations.
+    """
+    text, mode, start, stop = task
+    first = {}
+    variants = get_engine(mode).iter_combination_range(text, start, stop)
+    for index, variant in enumerate(variants, start):
+        first.setdefault(variant.encode("utf-8"), index)
+    return first
+
+
+def serialize_range(task):
+    """Serialize variants of a "get all" result, one per line. Runs inside a pool process.
+
+    Args:
+        task (Tuple): ``(text, mode, start, stop, indices, output_format)``, the variants
+            ``start`` to ``stop - 1`` of ``CombinationSet(text, slots, indices)``, as
+            ``txt`` or ``ndjson`` lines.
+
+    Returns:
+        bytes: The UTF-8 encoded lines.
+    """
+    text, mode, start, stop, indices, output_format = task
+    text, slots = get_engine(mode).find_slots(text)
+    variants = CombinationSet(text, slots, indices)[start:stop]
+    if output_format == "ndjson":
+        variants = (json.dumps(variant, ensure_ascii=False) for variant in variants)
+    return "".join(variant + "\n" for variant in variants).encode("utf-8")
+
+
+def iter_serialized(variants, mode, output_format):
+    """Serialize a whole "get all" result in the pool.
+
+    Args:
+        variants (CombinationSet): The result.
+        mode (str): Its leetspeak mode.
+        output_format (str): ``txt`` or ``ndjson``.
+
+    Returns:
+        Iterator[bytes]: Encoded chunks of lines, in order.
+    """
+    tasks = []
+    for start in range(0, len(variants), SERIALIZE_CHUNK_VARIANTS):
+        stop = min(start + SERIALIZE_CHUNK_VARIANTS, len(variants))
+        if variants.indices is None:
+            tasks.append((variants.text, mode, start, stop, None, output_format))
+        else:
+            # Only the numbers of the chunk are sent
+            indices = variants.indices[start:stop]
+            tasks.append((variants.text, mode, 0, stop - start, indices, output_format))
+    if len(tasks) <= 1:
+        # Not worth a round trip to the pool
+        return map(serialize_range, tasks)
+    return imap_ordered(serialize_range, tasks)